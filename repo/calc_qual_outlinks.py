@@ -1,92 +1,226 @@
-from crawler.parser import Parser
-from crawler.webpage import WebPage
-from utils.datasetIR import load_collection_url2ids_mappings
+import os
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 
-from typing import Iterator
+from crawler.parser import Parser, QSCORER_CHECKPOINT
+from utils.datasetIR import load_collection_url2ids_mappings, source_key
+
+import numpy as np
 from tqdm import tqdm
 
 from utils.config import config
 
-def chunk_url2docids(url2docids: dict, batch_size: int) -> Iterator[list]:
+def cache_fpath(cache_dir: str, name: str, ext: str, *key_parts) -> str:
     """
-        Chunks the url2docids dictionary into batches of size batch_size and returns an iterator over them.
+        Return the path of a cache file, keyed by the artifacts it is derived from, so that a stale cache is never loaded.
 
         Args:
+            cache_dir: directory of the cache file.
+            name: prefix of the file name.
+            ext: extension of the file name.
+            key_parts: values identifying the sources of the cache (e.g., source_key of the input files).
+    """
+    key = hashlib.sha1(repr(key_parts).encode()).hexdigest()
+    return os.path.join(cache_dir, f"{name}_{key}.{ext}")
+
+def load_qscores_array(fpath: str, url2docids: dict, parser: Parser) -> np.ndarray:
+    """
+        Preloads the quality scores of all the pages in the collection into a contiguous array indexed by docno.
+        Pages without a quality score are stored as NaN.
+        The array is loaded from file if it exists, otherwise it is built and stored.
+
+        Args:
+            fpath: path to the .npy file storing the quality scores, keyed by the url2docids file and the quality scorer checkpoint.
             url2docids: dict of url to docid mappings.
-            batch_size: size of the batches.
+            parser: parser object used to parse page quality.
     """
-    batch = []
-    for url, docid in url2docids.items():
-        batch.append((url, docid))
-        if len(batch) == batch_size:
-            yield batch
-            batch = []
-    if batch:  
-        yield batch
-    
-def compute_mean_link_quality(outlinks: list, parser: Parser, url2docids: dict) -> float:
+    if os.path.exists(fpath):
+        print(f"Loading quality scores from file={fpath}.")
+        return np.load(fpath)
+
+    qscores = parser.build_qscore_table(url2docids.values(), len(url2docids))
+    tmp_fpath = f"{fpath}.{os.getpid()}.tmp"
+    with open(tmp_fpath, "wb") as f: # np.save would append an extension to the path
+        np.save(f, qscores)
+    os.replace(tmp_fpath, fpath)
+    print(f"Saved quality scores to file={fpath}.")
+    return qscores
+
+def _mean_qscore(ids: np.ndarray, qscores: np.ndarray) -> tuple:
+    """
+        Reduces the quality scores of a set of pages to their mean.
+        Returns a tuple storing the sum of the valid scores, the number of valid scores and the number of missing pages.
+
+        Args:
+            ids: int64 array of docnos (negative values mark pages not in the collection).
+            qscores: float32 array of quality scores indexed by docno (NaN for missing scores).
+    """
+    in_collection = ids >= 0
+    vals = qscores[np.maximum(ids, 0)] # branchless gather, missing pages read docno 0 and are masked out below
+    valid = in_collection & ~np.isnan(vals)
+    sum_qual = np.add.reduce(np.where(valid, vals, np.float32(0.0)))
+    return float(sum_qual), int(np.count_nonzero(valid)), int(ids.size - np.count_nonzero(in_collection))
+
+def compute_mean_link_quality(outlinks_ids: np.ndarray, qscores: np.ndarray) -> float:
     """
         Computes the mean quality of the outlinks of a page.
         
         Args:
-            outlinks: list of outlinked URLS of a page.
-            parser: parser object used to compute link quality.
+            outlinks_ids: int64 array of docnos of the outlinked pages (-1 for pages not in the collection).
+            qscores: array of quality scores indexed by docno (NaN for missing scores).
+    """
+    sum_qual, num_pages, none_links = _mean_qscore(outlinks_ids, qscores)
+
+    mean_qual = sum_qual / num_pages if num_pages > 0 else None # compute mean quality
+    return mean_qual, none_links
+
+def build_outlinks_ids(url2docids: dict, url2docnos: dict, parser: Parser, batch_size: int = 5_000_000) -> tuple:
+    """
+        Parses the outlinks of all the pages in the collection once and translates them to docnos.
+        Returns a tuple of arrays (flat_ids, offsets) in CSR format: the outlinks of the page with docno d are flat_ids[offsets[d]:offsets[d+1]].
+
+        Args:
             url2docids: dict of url to docid mappings.
+            url2docnos: dict of url to docno mappings.
+            parser: parser object used to parse outlinks.
+            batch_size: number of pages between two progress messages.
     """
-    mean_qual = 0
-    num_pages = 0
-    none_links = 0
+    outlinks_ids = []
+    offsets = np.zeros(len(url2docids) + 1, dtype=np.int64)
 
-    for link_url in outlinks: # iterate over outlinked URLs 
-        linked_docid = url2docids.get(link_url, None) # get docid
-        if linked_docid is None:
-            none_links += 1
-            continue
+    update_every = min(batch_size, 100_000) # number of pages between two progress bar updates
 
-        linked_page = WebPage(url=link_url, id=linked_docid)
+    with tqdm(total=len(url2docids), desc="Parsing outlinks", unit="url", dynamic_ncols=True, mininterval=5.0, miniters=update_every) as pbar: # process pages in the collection
+        for idx, (url, docid) in enumerate(url2docids.items()):
+            outlinks = parser.parse_outlinks_by_id(docid, url) # parse outlinks
+            if outlinks is None:
+                outlinks = []
 
-        qual = parser.parse_qscore(linked_page) # parse score
-        if qual is not None:
-            mean_qual += qual
-            num_pages += 1
+            ids = np.fromiter((url2docnos.get(link_url, -1) for link_url in outlinks), dtype=np.int64, count=len(outlinks)) # get docnos
+            outlinks_ids.append(ids)
+            offsets[url2docnos[url] + 1] = len(ids)
 
-    mean_qual = mean_qual / num_pages if num_pages > 0 else None # compute mean quality
-    return mean_qual, none_links
+            if (idx + 1) % update_every == 0:
+                pbar.update(update_every)
+            if (idx + 1) % batch_size == 0:
+                print(f"Parsed outlinks of {idx + 1} pages up to now.")
+        pbar.update(len(url2docids) - pbar.n) # pages of the last partial update
+
+    np.cumsum(offsets, out=offsets)
+    flat_ids = np.concatenate(outlinks_ids) if outlinks_ids else np.empty(0, dtype=np.int64)
+    return flat_ids, offsets
 
-def get_outlinks_qual(url2docids: dict, parser: Parser, batch_size: int = 5_000_000) -> tuple:
+def load_outlinks_ids(fpath: str, url2docids: dict, url2docnos: dict, parser: Parser, batch_size: int = 5_000_000) -> tuple:
     """
-        Computes the mean quality of the outlinks of the pages in the collection.
-        Returns a tuple of lists containing the page quality and the mean quality of the outlinked pages in the Web collection.
+        Loads the outlinks of the pages in the collection (in CSR format) from file, building and storing them if the file does not exist.
 
         Args:
+            fpath: path to the .npz file storing the outlinks, keyed by the url2docids file and the outlinks directory.
             url2docids: dict of url to docid mappings.
-            parser: parser object used to compute page quality.
+            url2docnos: dict of url to docno mappings.
+            parser: parser object used to parse outlinks.
+            batch_size: number of pages between two progress messages.
+    """
+    if os.path.exists(fpath):
+        print(f"Loading outlinks from file={fpath}.")
+        with np.load(fpath) as data:
+            return data["flat_ids"], data["offsets"]
+
+    flat_ids, offsets = build_outlinks_ids(url2docids, url2docnos, parser, batch_size=batch_size)
+    tmp_fpath = f"{fpath}.{os.getpid()}.tmp"
+    with open(tmp_fpath, "wb") as f: # np.savez_compressed would append an extension to the path
+        np.savez_compressed(f, flat_ids=flat_ids, offsets=offsets)
+    os.replace(tmp_fpath, fpath)
+    print(f"Saved outlinks to file={fpath}.")
+    return flat_ids, offsets
+
+QUAL_DTYPE = np.dtype([("page", "<f4"), ("links", "<f4")]) # on-disk record of a page quality and its mean outlinks quality
+
+_shared = {} # read-only arrays shared with the worker processes
+
+def _init_worker(flat_ids: np.ndarray, offsets: np.ndarray, qscores: np.ndarray) -> None:
+    """
+        Initialises a worker process with the arrays needed to compute the mean quality of the outlinks.
+
+        Args:
+            flat_ids: int64 array of the concatenated docnos of the outlinks of all the pages.
+            offsets: int64 array of the offsets of the outlinks of each page in flat_ids.
+            qscores: array of quality scores indexed by docno.
+    """
+    _shared["flat_ids"] = flat_ids
+    _shared["offsets"] = offsets
+    _shared["qscores"] = qscores
+
+def _batch_outlinks_qual(start: int, end: int) -> tuple:
+    """
+        Computes the page quality and the mean quality of the outlinks of the pages with docno in [start, end).
+        Returns a tuple storing the array of page qualities, the array of mean outlinks qualities and the number of outlinks not in the collection.
+
+        Args:
+            start: first docno of the batch.
+            end: last docno (excluded) of the batch.
+    """
+    flat_ids, offsets, qscores = _shared["flat_ids"], _shared["offsets"], _shared["qscores"]
+
+    page_qual = np.empty(end - start, dtype=np.float32)
+    links_qual = np.empty(end - start, dtype=np.float32)
+    k = 0
+    none_links = 0
+
+    for docno in range(start, end):
+        outlinks_ids = flat_ids[offsets[docno]:offsets[docno + 1]]
+        mean_qual, new_none = compute_mean_link_quality(outlinks_ids=outlinks_ids, qscores=qscores)
+        if mean_qual is not None:
+            page_qual[k] = qscores[docno] # page quality
+            links_qual[k] = mean_qual
+            k += 1
+        none_links += new_none
+
+    return page_qual[:k], links_qual[:k], none_links
+
+def get_outlinks_qual(flat_ids: np.ndarray, offsets: np.ndarray, qscores: np.ndarray, out_fpath: str, batch_size: int = 5_000_000, num_workers: int | None = None) -> tuple:
+    """
+        Computes the mean quality of the outlinks of the pages in the collection, processing batches of pages in parallel.
+        The results of each batch are streamed to a binary file of QUAL_DTYPE records, which is memory-mapped at the end.
+        Returns a tuple of arrays containing the page quality and the mean quality of the outlinked pages in the Web collection.
+
+        Args:
+            flat_ids: int64 array of the concatenated docnos of the outlinks of all the pages.
+            offsets: int64 array of the offsets of the outlinks of each page in flat_ids.
+            qscores: array of quality scores indexed by docno.
+            out_fpath: path to the binary file where the results are streamed.
             batch_size: size of the batches.
+            num_workers: number of worker processes (defaults to the number of CPUs).
     """
-    page_qual, links_qual = [], []
+    num_docs = len(offsets) - 1
+    starts = list(range(0, num_docs, batch_size))
+    ends = [min(start + batch_size, num_docs) for start in starts]
 
+    num_records = 0
     none_links = 0
-    with tqdm(total=len(url2docids), desc="Processing URLs", unit="url", dynamic_ncols=True) as pbar: # process pages in the collection
-        for idx, batch in enumerate(chunk_url2docids(url2docids, batch_size)):
-            for url, docid in batch:
-                page = WebPage(url=url, id=docid)
-                outlinks = parser.parse_outlinks(page) # parse outlinks
-                qual = parser.parse_qscore(page) # parse page quality
-
-                if outlinks is not None:
-                    mean_qual, new_none = compute_mean_link_quality(outlinks=outlinks, parser=parser, url2docids=url2docids)
-                    if mean_qual is not None:
-                        page_qual.append(qual)
-                        links_qual.append(mean_qual)        
-
-                pbar.update(1)
-                none_links += new_none
+    with tqdm(total=num_docs, desc="Processing URLs", unit="url", dynamic_ncols=True, mininterval=5.0) as pbar, \
+         open(out_fpath, "wb", buffering=1<<20) as f, \
+         ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(flat_ids, offsets, qscores)) as executor:
+        for start, end, (batch_page_qual, batch_links_qual, new_none) in zip(starts, ends, executor.map(_batch_outlinks_qual, starts, ends)):
+            records = np.empty(len(batch_page_qual), dtype=QUAL_DTYPE)
+            records["page"] = batch_page_qual
+            records["links"] = batch_links_qual
+            records.tofile(f) # stream the batch to disk
+            num_records += len(records)
+            none_links += new_none
 
+            pbar.update(end - start)
             print("None links up to now:", none_links)
+
+    if num_records > 0:
+        records = np.memmap(out_fpath, dtype=QUAL_DTYPE, mode="r")
+    else:
+        records = np.empty(0, dtype=QUAL_DTYPE) # empty files cannot be memory-mapped
+    page_qual, links_qual = records["page"], records["links"]
          
-    print(f"Processed {len(url2docids)} URLs.")
-    print(f"Mean page quality: {sum(page_qual) / len(page_qual)}")
-    print(f"Mean link quality: {sum(links_qual) / len(links_qual)}")
+    print(f"Processed {num_docs} URLs.")
+    print(f"Mean page quality: {page_qual.mean()}")
+    print(f"Mean link quality: {links_qual.mean()}")
     return page_qual, links_qual
 
 def main():
@@ -95,21 +229,32 @@ def main():
     URL_DOCIDS_PATH = COLLECTIONS[collection]["url2docids_fpath"]
     PLOTS_DIR = config.get("paths").get("plots_dir")
     OUTPUT_FPATH = PLOTS_DIR + "neighbours_quality.tsv"
+    QUAL_FPATH = PLOTS_DIR + "neighbours_quality.bin"
+    # caches are keyed by their sources, since docnos are positions in the url2docids file
+    URL_DOCIDS_KEY = source_key(URL_DOCIDS_PATH)
+    OUTLINKS_IDS_FPATH = cache_fpath(PLOTS_DIR, "outlinks_ids", "npz", URL_DOCIDS_KEY, COLLECTIONS[collection]["outlinks_dir"])
+    QSCORES_FPATH = cache_fpath(PLOTS_DIR, "qscores", "npy", URL_DOCIDS_KEY, config.get('qscorer').get('checkpoints')[QSCORER_CHECKPOINT][collection])
 
     # load collection url to docid mappings
-    url2docids, _ = load_collection_url2ids_mappings(URL_DOCIDS_PATH)
+    url2docids, url2docnos = load_collection_url2ids_mappings(URL_DOCIDS_PATH)
 
     print(f"Loaded {len(url2docids)} url2docids mappings.")
 
-    parser = Parser("cw22b", to_parse=["qscores"], verbose=False)
+    # the quality scorer checkpoint is only loaded if the quality scores are not stored yet
+    to_parse = [] if os.path.exists(QSCORES_FPATH) else ["qscores"]
+    parser = Parser("cw22b", to_parse=to_parse, verbose=False)
+
+    # preload quality scores once, indexed by docno
+    qscores = load_qscores_array(QSCORES_FPATH, url2docids, parser)
+
+    # translate outlinks to docnos once for the whole collection
+    flat_ids, offsets = load_outlinks_ids(OUTLINKS_IDS_FPATH, url2docids, url2docnos, parser, batch_size=1_000_000)
     
     # get lists of mean quality of pages in the collection and mean quality of outlinked pages
-    page_qual, links_qual = get_outlinks_qual(url2docids, parser, batch_size=1_000_000)
+    page_qual, links_qual = get_outlinks_qual(flat_ids, offsets, qscores, QUAL_FPATH, batch_size=1_000_000)
 
     # write to file
-    with open(OUTPUT_FPATH, "w") as f:
-        for p, l in zip(page_qual, links_qual):
-            f.write(f"{p}\t{l}\n")
+    np.savetxt(OUTPUT_FPATH, np.stack([page_qual, links_qual], axis=1), fmt="%.6f", delimiter="\t")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,26 +1,20 @@
 
 import numpy as np
 import sys, os
-import random
 
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from utils.config import config
 from utils.component import Component
-from utils.datasetIR import load_collection_url2ids_mappings
+from utils.datasetIR import load_collection_url2ids_mappings, MmapURLMapping
+from utils.utils import sample_keys
 from crawler.webpage import WebPage
-from indexer.dataset import Downloads
 
 COLLECTIONS = config.get('collections', None)
 
 RANDOM_SEED = config.get('random_seed')
 
-SAVE_EVERY_N_PAGES = config.get('orchestrator').get("save_every_n_pages")
-
-# set random seed
-random.seed(RANDOM_SEED)
-
 
 
 class Fetcher(Component):
@@ -29,13 +23,14 @@ class Fetcher(Component):
         It simulates the download process of web pages.
     """
    
-    def __init__(self, collection: str, downloaded_pages_fpath: str, verbose: bool = True) -> None:
+    def __init__(self, collection: str, downloaded_pages_fpath: str, max_pages: int = 0, verbose: bool = True) -> None:
         """
             Constructor of the fetcher
 
             Args:
                 collection: string identifier of the collection
                 downloaded_pages_fpath: path to the file where the downloaded pages will be stored
+                max_pages: maximum number of pages to be downloaded (non-positive for the whole collection)
                 verbose: boolean flag to print log messages
             """
         super().__init__(verbose)
@@ -46,21 +41,35 @@ class Fetcher(Component):
         self.storage_fpath = downloaded_pages_fpath
         url2docids_fpath = COLLECTIONS[collection]["url2docids_fpath"]
 
-        self.downloads_dataset = Downloads(collection=collection)
-
-        if os.path.exists(self.storage_fpath):
+        if os.path.exists(self.storage_fpath) or os.path.exists(self.storage_fpath + ".npy"):
             self.log("Output file already exists. Exiting")
             raise FileExistsError(f"Error: file={self.storage_fpath} already exists.")
 
-        self.downloaded = []
         self.num_stored = 0
+        self.rng = np.random.default_rng(RANDOM_SEED)
 
         self.log(f"Initialising url2docids mapping from file={url2docids_fpath}.")
-        self.__url2docids, self.__url2docnos = load_collection_url2ids_mappings(url2docids_fpath)
+        self.__url2docids, self.__url2docnos = load_collection_url2ids_mappings(url2docids_fpath,
+                                                                                mmap=COLLECTIONS[collection].get("mmap_url2docids", False),
+                                                                                intern=COLLECTIONS[collection].get("intern_urls", False))
     
         self.total_docs = len(self.__url2docids)
 
-        self.log(f"Docnos of downloaded pages will be stored at={self.storage_fpath}.")
+        # reverse mapping from docnos to URLs, used to download pages enqueued by docno.
+        # memory-mapped mappings read it from the on-disk index, in-memory ones keep a list of references to the URL keys
+        if isinstance(self.__url2docids, MmapURLMapping):
+            self.__docno2url = self.__url2docids.docno2url
+        else:
+            self.__docno2url = list(self.__url2docids).__getitem__
+
+        # docnos of downloaded pages are written in place into a single memory-mapped file, -1 marks unused slots
+        capacity = max_pages if max_pages > 0 else self.total_docs
+        if not os.path.exists(os.path.dirname(self.storage_fpath)):
+            os.makedirs(os.path.dirname(self.storage_fpath))
+        self.downloaded = np.lib.format.open_memmap(self.storage_fpath + ".npy", mode="w+", dtype=np.int64, shape=(capacity,))
+        self.downloaded[:] = -1
+
+        self.log(f"Docnos of downloaded pages will be stored at={self.storage_fpath}.npy.")
 
     def download(self, url: str) -> WebPage:
         """
@@ -83,6 +92,35 @@ class Fetcher(Component):
         self.log(f"Document with id={id} downloaded.")
         return WebPage(id=id, url=url, docno=docno)
 
+    def download_docno(self, docno: int) -> WebPage:
+        """
+            Download a document given its docno
+
+            Args: 
+                docno: docno of the document to be downloaded
+
+            Returns:
+                WebPage: object representing the downloaded document
+        """
+        url = self.docno2url(docno)
+        self.log(f"Downloading document from url={url}.")
+
+        id = self.url2id(url)
+        if id is None:
+           return None
+
+        self.log(f"Document with id={id} downloaded.")
+        return WebPage(id=id, url=url, docno=docno)
+
+    def docno2url(self, docno: int) -> str:
+        """
+            Return the URL of the document with a given docno
+
+            Args:
+                docno: docno of the document
+        """
+        return self.__docno2url(docno)
+
     def url2id(self, url: str):
         """
             Return the id of the document with a given url
@@ -111,14 +149,27 @@ class Fetcher(Component):
             return None
  
     
-    def store(self, url: str) -> None:
+    def url2docno_batch(self, urls: list) -> list:
+        """
+            Return the docnos of the documents with the given urls (None for urls not in the collection)
+
+            Args:
+                urls: list of URLs of the documents
+        """
+        get_docno = self.__url2docnos.get
+        return [get_docno(url) for url in urls]
+ 
+    def store(self, docno: int) -> None:
         """
             Store a document with a given docno
 
             Args:
-                url: URL of the document to be stored
+                docno: docno of the document to be stored
         """
-        self.downloaded.append(self.url2docno(url))
+        if self.num_stored >= len(self.downloaded):
+            raise IndexError(f"Error: trying to store more than {len(self.downloaded)} downloaded pages.")
+        self.downloaded[self.num_stored] = docno
+        self.num_stored += 1
 
 
     def write_downloads_to_file(self, last: bool = False) -> None:
@@ -128,14 +179,9 @@ class Fetcher(Component):
             Args:
                 last: boolean flag to indicate if this is the last batch of downloaded pages
         """
-        print(f"Saving {len(self.downloaded)} downloaded docnos to file={self.storage_fpath}.")
-        checkpoint_id = int((len(self.downloaded) + self.num_stored) / SAVE_EVERY_N_PAGES) + (1 if last else 0)
-        fpath = f"{self.storage_fpath}_{checkpoint_id}"
-        
-        if not os.path.exists(os.path.dirname(fpath)):
-            os.makedirs(os.path.dirname(fpath))
-        np.save(fpath, self.downloaded)
-        print(f"Saved {len(self.downloaded)} docnos to file={fpath}.")
+        print(f"Saving {self.num_stored} downloaded docnos to file={self.storage_fpath}.npy.")
+        self.downloaded.flush()
+        print(f"Saved {self.num_stored} docnos to file={self.storage_fpath}.npy.")
 
     def close(self) -> None:
         """
@@ -143,11 +189,8 @@ class Fetcher(Component):
         """
         self.log("Applying exit functions.")
 
-        if not os.path.exists(os.path.dirname(self.storage_fpath)):
-            os.makedirs(os.path.dirname(self.storage_fpath))
-
-        self.log(f"Saving {len(self.downloaded)} downloaded docnos to file={self.storage_fpath}.")
-        np.save(self.storage_fpath, np.array(self.downloaded))
+        self.log(f"Saving {self.num_stored} downloaded docnos to file={self.storage_fpath}.npy.")
+        self.downloaded.flush()
         
         self.log("Exited.")
 
@@ -167,7 +210,7 @@ class Fetcher(Component):
             raise ValueError(f"Number of seed URLs requested exceeds {len(self.__url2docids)}.")
 
         if strategy == "random":
-            urls = random.sample(list(self.__url2docids.keys()), n)
+            urls = sample_keys(self.__url2docids, n, rng=self.rng)
         else:
             raise ValueError(f"Error: strategy={strategy} not implemented.")
 
@@ -178,7 +221,7 @@ class Fetcher(Component):
         """
             Return the number of downloaded pages
         """
-        return len(self.downloaded) + self.num_stored
+        return self.num_stored
     
     def get_total_docs(self) -> int:
         """
@@ -192,12 +235,11 @@ class Fetcher(Component):
         """
         self.log("Checkpointing downloaded pages.")
         self.write_downloads_to_file()
-        self.num_stored += len(self.downloaded)
-        self.downloaded = []
        
-    def all_downloaded_docnos(self) -> list:
+    def all_downloaded_docnos(self) -> np.ndarray:
         """
-            Return the list of docnos of the downloaded pages
+            Return the read-only array of docnos of the downloaded pages
         """
-        downl_docnos = self.downloads_dataset.load_downloads_docnos(data_dir=os.path.dirname(self.storage_fpath), limit=None)
+        downl_docnos = self.downloaded[:self.num_stored].view()
+        downl_docnos.flags.writeable = False
         return downl_docnos
\ No newline at end of file
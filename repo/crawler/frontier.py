@@ -1,5 +1,5 @@
 import sys, os
-import random
+import numpy as np
 from abc import ABC, abstractmethod
 
 from collections import deque
@@ -9,10 +9,9 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from crawler.webpage import WebPage
 from utils.config import config
 from utils.component import Component
-from utils.priorityqueue import PQueuePriorityQueue, PQueueHeap
+from utils.priorityqueue import PQueuePriorityQueue, PQueueHeap, PQueueBucket
 
 RANDOM_SEED = config.get('random_seed', None)
-random.seed(RANDOM_SEED)
 
 
 class FrontierManager(ABC, Component):
@@ -59,6 +58,39 @@ class FrontierManager(ABC, Component):
         """
         pass
 
+    def add_batch(self, pages: list, father: WebPage = None) -> None:
+        """
+            add a batch of pages sharing the same father to the frontier
+        """
+        for page in pages:
+            self.add(page, father)
+
+    def update_batch(self, pages: list, father: WebPage = None) -> None:
+        """
+            update a batch of pages sharing the same father in the frontier
+        """
+        for page in pages:
+            self.update(page, father)
+
+    def submit_batch(self, pages: list, seen_flags: list, father: WebPage = None) -> None:
+        """
+            add or update a batch of pages sharing the same father, in order: pages already seen are updated, the others are added.
+            consecutive pages with the same operation are submitted together, so that pages with equal priority keep the order of the batch
+
+            Args:
+                pages: list of WebPage objects to be added to or updated in the frontier
+                seen_flags: list of boolean flags, one per page, telling whether the page is already seen
+                father: WebPage object representing the father of the pages
+        """
+        start = 0
+        for end in range(1, len(pages) + 1):
+            if end == len(pages) or seen_flags[end] != seen_flags[start]: # end of a run of pages with the same operation
+                if seen_flags[start]:
+                    self.update_batch(pages[start:end], father)
+                else:
+                    self.add_batch(pages[start:end], father)
+                start = end
+
     @abstractmethod
     def enqueued(self) -> int:
         """
@@ -91,30 +123,56 @@ class RandomFrontierManager(FrontierManager):
         Random frontier manager.
 
         This frontier manager selects pages randomly from the frontier and never updates priorities.
+        Pages are enqueued by docno in a contiguous int64 array, that is grown by doubling.
+        Random positions are drawn from a buffer of uniform samples, refilled in batches by a numpy generator.
     """
     name = "RandomFrontierManager"
+    RANDOM_BUFFER_SIZE = 65536
 
-    def __init__(self, verbose: bool = True) -> None:
+    def __init__(self, verbose: bool = True, capacity: int = 1024) -> None:
         """
             Constructor of the random frontier manager
 
             Args: 
                 verbose: boolean flag to print log messages
+                capacity: initial capacity of the queue
         """
         FrontierManager.__init__(self, verbose)
         self.log(f"Initialising RandomFrontierManager.")
-        self.queue = []
+        self.queue = np.empty(max(capacity, 1), dtype=np.int64)
+        self.size = 0
+        self.rng = np.random.default_rng(RANDOM_SEED)
+        self.random_buffer = self.rng.random(self.RANDOM_BUFFER_SIZE)
+        self.random_pos = 0
 
-    def pop(self) -> WebPage:
+    def __append(self, docno: int) -> None:
         """
-            Pop a random page from the frontier
+            Append a docno to the queue, doubling its capacity if full
+
+            Args:
+                docno: integer identifier of the page
         """
-        if len(self.queue) == 0:
+        if self.size == len(self.queue):
+            self.queue = np.resize(self.queue, 2 * len(self.queue))
+        self.queue[self.size] = docno
+        self.size += 1
+
+    def pop(self) -> int:
+        """
+            Pop the docno of a random page from the frontier
+        """
+        if self.size == 0:
             raise IndexError("Error: trying to pop from empty queue")
-        random_index = random.randint(0, len(self.queue) - 1)
-        # swap the random element with the last element
-        self.queue[random_index], self.queue[-1] = self.queue[-1], self.queue[random_index]
-        return self.queue.pop() # pop last
+        if self.random_pos == len(self.random_buffer): # refill the buffer of uniform samples
+            self.random_buffer = self.rng.random(self.RANDOM_BUFFER_SIZE)
+            self.random_pos = 0
+        random_index = min(int(self.random_buffer[self.random_pos] * self.size), self.size - 1) # guard against rounding up
+        self.random_pos += 1
+        docno = int(self.queue[random_index])
+        # move the last element into the freed slot
+        self.size -= 1
+        self.queue[random_index] = self.queue[self.size]
+        return docno
 
     def add(self, page: WebPage, father: WebPage = None) -> None:
         """
@@ -124,8 +182,7 @@ class RandomFrontierManager(FrontierManager):
                 page: WebPage object to be added to the frontier
                 father: WebPage object representing the father of the page
         """
-        url = page.get_url()
-        self.queue.append(url)
+        self.__append(page.get_docno())
 
     def add_with_max_priority(self, url: str, docid: int) -> None:
         """
@@ -135,7 +192,7 @@ class RandomFrontierManager(FrontierManager):
                 url: string url of the page
                 docid: integer identifier of the page
         """
-        self.queue.append(url)
+        self.__append(docid)
 
     def update(self, page: WebPage, father: WebPage = None) -> None:
         """
@@ -151,7 +208,7 @@ class RandomFrontierManager(FrontierManager):
         """
             Return the number of enqueued pages
         """
-        return len(self.queue)
+        return self.size
     
 class QualityFrontierManager(FrontierManager):
     """
@@ -165,7 +222,7 @@ class QualityFrontierManager(FrontierManager):
     priority_pages = 0
     no_father_pages = 0
 
-    def __init__(self, updates = False, verbose: bool = True, oracle: bool = False) -> None:
+    def __init__(self, updates = False, verbose: bool = True, oracle: bool = False, bucket_queue: bool = False) -> None:
         """
             Constructor of the quality frontier manager
             
@@ -173,11 +230,15 @@ class QualityFrontierManager(FrontierManager):
                 updates: boolean flag to enable updates of the priorities
                 verbose: boolean flag to print log messages
                 oracle: boolean flag to use an oracle to assign priorities
+                bucket_queue: boolean flag to use a bucket queue over [MIN_PRIORITY, MAX_PRIORITY] instead of a heap
         """
         FrontierManager.__init__(self, verbose)
         self.log(f"Initialising QualityFrontierManager.")
         
-        self.queue = PQueuePriorityQueue() if updates else PQueueHeap()
+        if bucket_queue:
+            self.queue = PQueueBucket(min_priority=self.MIN_PRIORITY, max_priority=self.MAX_PRIORITY)
+        else:
+            self.queue = PQueuePriorityQueue() if updates else PQueueHeap()
 
         self.log(f"Using a queue of type={type(self.queue)}.")
 
@@ -187,14 +248,14 @@ class QualityFrontierManager(FrontierManager):
         else:
             raise NotImplementedError("Error, QualityFrontierManager not oracle-based not implemented yet.")
         
-    def pop(self) -> str:
+    def pop(self) -> int:
         """
-            Get the maximum priority page from the frontier
+            Get the docno of the maximum priority page from the frontier
         """
         if self.queue.enqueued() == 0:
             raise IndexError("Error: trying to pop from empty queue")
-        url, priority = self.queue.get()
-        return url # pop max priority page
+        docno, priority = self.queue.get()
+        return docno # pop max priority page
 
     def add(self, page: WebPage, father: WebPage) -> None:
         """
@@ -207,7 +268,7 @@ class QualityFrontierManager(FrontierManager):
         url = page.get_url()
 
         if father is None: # check if page is a seed
-            self.add_with_max_priority(url, docid=-1)
+            self.add_with_max_priority(url, docid=page.get_docno())
             self.no_father_pages += 1
             self.priority_pages +=1
             return
@@ -223,7 +284,31 @@ class QualityFrontierManager(FrontierManager):
             self.no_priority_pages +=1
         else:
             self.priority_pages +=1 
-        self.queue.put(item=url, priority=priority)
+        self.queue.put(item=page.get_docno(), priority=priority)
+
+    def add_batch(self, pages: list, father: WebPage = None) -> None:
+        """
+            Add a batch of pages sharing the same father to the frontier, inserting them in the queue at once
+
+            Args:
+                pages: list of WebPage objects to be added to the frontier
+                father: WebPage object representing the father of the pages
+        """
+        if (father is None) or (not self.oracle): # seeds and errors are handled page by page
+            return FrontierManager.add_batch(self, pages, father)
+
+        docnos, priorities = [], []
+        for page in pages:
+            priority = page.get_metadata(key="qscore")
+            if priority is None:
+                priority = self.MIN_PRIORITY
+                self.log(f"Warning: page={page.get_url()} has no priority, setting it to {priority}.")
+                self.no_priority_pages +=1
+            else:
+                self.priority_pages +=1
+            docnos.append(page.get_docno())
+            priorities.append(priority)
+        self.queue.put_batch(items=docnos, priorities=priorities)
 
     def add_with_max_priority(self, url: str, docid: int) -> None:
         """
@@ -231,9 +316,9 @@ class QualityFrontierManager(FrontierManager):
 
             Args:
                 url: string url of the page
-                docid: internal unique identifier of the page
+                docid: internal unique identifier (docno) of the page
         """
-        self.queue.put(item=url, priority=self.MAX_PRIORITY)
+        self.queue.put(item=docid, priority=self.MAX_PRIORITY)
     
 
     def update(self, page: WebPage, father: WebPage) -> bool:
@@ -255,7 +340,7 @@ class QualityFrontierManager(FrontierManager):
             priority = self.MIN_PRIORITY
             self.log(f"Warning: page={url} has no priority, setting it to {priority}.")
     
-        return self.queue.update(item=url, priority=priority)
+        return self.queue.update(item=page.get_docno(), priority=priority)
 
     def enqueued(self) -> int:
         """
@@ -263,19 +348,19 @@ class QualityFrontierManager(FrontierManager):
         """
         return self.queue.enqueued()
     
-    def remove(self, url: str) -> None:
+    def remove(self, docno: int) -> None:
         """
             Remove a page from the frontier
 
             Args:
-                url: URL of the page to be removed
+                docno: docno of the page to be removed
         """
         num_enqueued = self.enqueued()
         
         if num_enqueued == 0:
             raise IndexError("Error: trying to pop from an empty frontier.")
        
-        self.queue.remove(url)
+        self.queue.remove(docno)
 
         if self.enqueued() == num_enqueued:
             raise ValueError(f"Error: the removal was not effective (num_enqueued still equal to {num_enqueued}).")
@@ -287,9 +372,9 @@ class QualityFrontierManager(FrontierManager):
         print(f"Number of pages with no father for the QualityFrontierManager: {self.no_father_pages}")
         return self.no_priority_pages, self.priority_pages
 
-    def get_all_urls(self) -> list:
+    def get_all_docnos(self) -> list:
         """
-            Return all the urls in the frontier
+            Return the docnos of all the pages in the frontier
         """
         return self.queue.get_all_items()
         
@@ -312,14 +397,14 @@ class BreadthFirstSearchFrontierManager(FrontierManager):
         self.log(f"Initialising BreadthFirstSearchFrontierManager.")
         self.queue = deque() # double-ended queue
 
-    def pop(self) -> str:
+    def pop(self) -> int:
         """
-            Pop a random url from the frontier
+            Pop the docno of the first enqueued page from the frontier
         """
         if len(self.queue) == 0:
             raise IndexError("Error: trying to pop from empty queue")
 
-        return self.queue.popleft() # pop first url from the frontier
+        return self.queue.popleft() # pop first docno from the frontier
 
     def add(self, page: WebPage, father: WebPage = None) -> None:
         """
@@ -329,8 +414,17 @@ class BreadthFirstSearchFrontierManager(FrontierManager):
                 page: WebPage object to be added to the frontier
                 father: WebPage object representing the father of the pages (ignored)
         """
-        url = page.get_url()
-        self.queue.append(url)
+        self.queue.append(page.get_docno())
+
+    def add_batch(self, pages: list, father: WebPage = None) -> None:
+        """
+            Add a batch of pages to the frontier, in order
+
+            Args:
+                pages: list of WebPage objects to be added to the frontier
+                father: WebPage object representing the father of the pages (ignored)
+        """
+        self.queue.extend([page.get_docno() for page in pages])
 
     def add_with_max_priority(self, url: str, docid: int) -> None:
         """
@@ -338,9 +432,9 @@ class BreadthFirstSearchFrontierManager(FrontierManager):
 
             Args:
                 url: string url of the page
-                docid: internal unique identifier of the page (ignored)
+                docid: internal unique identifier (docno) of the page
         """
-        self.queue.append(url)
+        self.queue.append(docid)
 
     def update(self, page: WebPage, father: WebPage = None) -> None:
         """
@@ -372,14 +466,14 @@ class DepthFirstSearchFrontierManager(FrontierManager):
         self.log(f"Initialising DepthFirstSearchFrontierManager.")
         self.queue = deque() # double-ended queue
 
-    def pop(self) -> str:
+    def pop(self) -> int:
         """
-            Pop the next page from the frontier
+            Pop the docno of the last enqueued page from the frontier
         """
         if len(self.queue) == 0:
             raise IndexError("Error: trying to pop from empty queue")
 
-        return self.queue.pop() # pop last url from the frontier
+        return self.queue.pop() # pop last docno from the frontier
 
     def add(self, page: WebPage, father: WebPage = None) -> None:
         """
@@ -389,8 +483,17 @@ class DepthFirstSearchFrontierManager(FrontierManager):
                 page: WebPage object to be added to the frontier
                 father: WebPage object representing the father of the pages (ignored)
         """
-        url = page.get_url()
-        self.queue.append(url)
+        self.queue.append(page.get_docno())
+
+    def add_batch(self, pages: list, father: WebPage = None) -> None:
+        """
+            Add a batch of pages to the frontier, in order
+
+            Args:
+                pages: list of WebPage objects to be added to the frontier
+                father: WebPage object representing the father of the pages (ignored)
+        """
+        self.queue.extend([page.get_docno() for page in pages])
 
     def add_with_max_priority(self, url: str, docid: int) -> None:
         """
@@ -398,9 +501,9 @@ class DepthFirstSearchFrontierManager(FrontierManager):
 
             Args:
                 url: string url of the page
-                docid: internal unique identifier of the page (ignored)
+                docid: internal unique identifier (docno) of the page
         """
-        self.queue.append(url)
+        self.queue.append(docid)
 
     def update(self, page: WebPage, father: WebPage = None) -> bool:
         """
@@ -418,7 +521,7 @@ class DepthFirstSearchFrontierManager(FrontierManager):
         """
         return len(self.queue)
 
-def init_frontier_manager(frontier_type: str, updates: bool, verbose= True):
+def init_frontier_manager(frontier_type: str, updates: bool, verbose= True, bucket_queue: bool = False):
     """
         Initialise a frontier manager of a given type
         
@@ -426,11 +529,12 @@ def init_frontier_manager(frontier_type: str, updates: bool, verbose= True):
             frontier_type: string identifier of the frontier manager
             updates: boolean flag to enable updates of the priorities
             verbose: boolean flag to print log messages
+            bucket_queue: boolean flag to use a bucket queue in the quality frontier manager
     """
     if frontier_type == "random":
         return RandomFrontierManager(verbose=verbose)
     elif frontier_type == "oracle-quality":
-        return QualityFrontierManager(updates=updates, verbose=verbose, oracle=True)
+        return QualityFrontierManager(updates=updates, verbose=verbose, oracle=True, bucket_queue=bucket_queue)
     elif frontier_type == "bfs":
         return BreadthFirstSearchFrontierManager(verbose=verbose)
     elif frontier_type == "dfs":
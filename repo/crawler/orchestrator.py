@@ -1,4 +1,5 @@
 import sys, os
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
@@ -27,15 +28,18 @@ SAVE_EVERY_N_PAGES = orch_cfg.get("save_every_n_pages")
 
 UPDATES_ENABLED = orch_cfg.get("updates_enabed")
 
+BUCKET_QUEUE = orch_cfg.get("bucket_queue", False)
+
 EXPERIMENT_NAME = orch_cfg.get("experiment_name", "exp_0")
 
 PAGERANK_PERIOD = config.get("pagerank").get("period")
 
 def save_seeds(seeds, fpath):
     print(f"Writing {len(seeds)} seeds to {fpath}")
-    with open(fpath, "w") as f:
-        for seed in seeds:
-            f.write(seed + "\n")
+    with open(fpath, "w", buffering=1<<20) as f:
+        if seeds:
+            f.write("\n".join(seeds))
+            f.write("\n")
 
 class Orchestrator(Component):
     """
@@ -81,6 +85,7 @@ class Orchestrator(Component):
         self.num_noutlinks = 0
         self.pagerank_period = None
         self.oracle = False
+        self.page_pool = [] # free list of WebPage objects reused for outlinks
         
         to_parse = []
 
@@ -94,7 +99,7 @@ class Orchestrator(Component):
 
         del SeedsGenerator
 
-        self.Fetcher = Fetcher(collection=collection, downloaded_pages_fpath=downloaded_pages_fpath, verbose=False)
+        self.Fetcher = Fetcher(collection=collection, downloaded_pages_fpath=downloaded_pages_fpath, max_pages=max_pages, verbose=False)
 
         self.log(f"Initialising frontier manager for type={frontier_type}", 1)
 
@@ -111,12 +116,12 @@ class Orchestrator(Component):
 
         self.log(f"Initialising parser for parsing {to_parse}", 1)
             
-        self.Parser = Parser(collection=collection, verbose=subcomponents_verbose, to_parse=to_parse)
+        self.Parser = Parser(collection=collection, verbose=subcomponents_verbose, to_parse=to_parse, dedup_outlinks=False) # outlinks are deduplicated on docnos
 
         seen_urls_capacity = (self.Fetcher.get_total_docs() + 10) if seen_urls_type != "set" else None
 
         self.SeenURLTester = init_url_seen_tester(tester_type=seen_urls_type, capacity=seen_urls_capacity)
-        self.FrontierManager = init_frontier_manager(frontier_type=frontier_type, updates=self.updates_enabled, verbose=True)
+        self.FrontierManager = init_frontier_manager(frontier_type=frontier_type, updates=self.updates_enabled, verbose=True, bucket_queue=BUCKET_QUEUE)
        
         self.log(f"Orchestrator initialised.", 1)
 
@@ -131,46 +136,62 @@ class Orchestrator(Component):
             Args:
                 page: WebPage object to be processed
         """
-        self.Fetcher.store(page.get_url())
+        self.Fetcher.store(page.get_docno()) # the docno is known from the download, no need to look up the url again
 
         page = self.Parser.parse_metadata(page) # extract metadata
 
-        outlinks = page.get_metadata("outlinks") # get outlinks
+        outlinks = page.metadata.get("outlinks") # get outlinks
 
         if outlinks is None:
-            self.log(f"Warning: page={page.get_url()} has no outlinks.", 2)
+            self.log(f"Warning: page={page.url} has no outlinks.", 2)
             self.num_noutlinks += 1
             outlinks = []
 
-        for linked_url in outlinks: # process each outlink
-            linked_docid = self.Fetcher.url2docno(linked_url)
-            
-            if linked_docid is None:
-                self.wrong_linked_docid += 1
-                continue
-
-            # create a new page object for the linked page
-            linked_page = WebPage(url=linked_url, docno=linked_docid, id=self.Fetcher.url2id(linked_url))
-
-            if self.oracle:
+        # loop-invariant lookups
+        fetcher, parser, frontier = self.Fetcher, self.Parser, self.FrontierManager
+        parse_qscores = self.oracle and ("qscores" in parser.get_to_parse())
+
+        # look up the docnos of all the outlinks, then deduplicate them on the int docnos rather than on the url strings.
+        # urls map to distinct docnos, so a dict keyed by docno keeps each outlink once in order of first occurrence.
+        linked_docnos = fetcher.url2docno_batch(outlinks)
+        docno2linked_url = dict(zip(linked_docnos, outlinks))
+        if None in docno2linked_url: # outlinks not in the collection, counted once per distinct url
+            del docno2linked_url[None]
+            self.wrong_linked_docid += len({linked_url for linked_docno, linked_url in zip(linked_docnos, outlinks) if linked_docno is None})
+        linked = [(linked_url, linked_docno) for linked_docno, linked_url in docno2linked_url.items()]
+        linked_seen_flags = self.SeenURLTester.is_seen_batch(list(docno2linked_url))
+        newly_seen = []
+        to_submit, to_submit_seen = [], []
+
+        # outlinks to add to or update in the frontier
+        candidates = [(linked_url, linked_docid, linked_seen) for (linked_url, linked_docid), linked_seen in zip(linked, linked_seen_flags) if self.updates_enabled or not linked_seen]
+        candidate_ids = [fetcher.url2id(linked_url) for linked_url, _, _ in candidates]
+        if parse_qscores: # score all the candidates in one batch
+            candidate_qscores = parser.parse_qscore_batch(candidate_ids, [linked_docid for _, linked_docid, _ in candidates])
+
+        page_pool = self.page_pool
+        for i, (linked_url, linked_docid, linked_seen) in enumerate(candidates): # process each outlink
+            # get a page object for the linked page from the pool
+            linked_page = page_pool.pop() if page_pool else WebPage()
+            linked_page.url, linked_page.docno, linked_page.id = linked_url, linked_docid, candidate_ids[i]
+            linked_page.metadata.clear()
+
+            if parse_qscores:
                 # get metadata of the linked page
-                to_parse = self.Parser.get_to_parse()
-                metadata = {}
-                if "qscores" in to_parse:
-                    qscore = self.Parser.parse_qscore(linked_page)
-                    metadata["qscore"] = qscore
-                linked_page.set_metadata(metadata)
+                linked_page.metadata["qscore"] = candidate_qscores[i]
                
-            if self.SeenURLTester.is_seen(linked_docid): # check if the linked page has been seen
-                if not self.updates_enabled:
-                    continue
-                # update the linked page in the frontier
-                res = self.FrontierManager.update(page=linked_page, father=page)
-                continue
-            else:
-                # mark the linked page as seen and add it to the frontier
-                self.SeenURLTester.mark_seen(linked_docid)
-                self.FrontierManager.add(page=linked_page, father=page)
+            # seen linked pages are updated in the frontier, the others are added to it and marked as seen
+            if not linked_seen:
+                newly_seen.append(linked_docid)
+            to_submit.append(linked_page)
+            to_submit_seen.append(linked_seen)
+
+        # outlinks are deduplicated, so submitting them after the loop, in outlink order, is equivalent
+        frontier.submit_batch(to_submit, to_submit_seen, father=page)
+        self.SeenURLTester.mark_seen_batch(newly_seen)
+
+        # frontiers only keep docnos, so the page objects can be reused for the next page
+        page_pool.extend(to_submit)
 
 
     def populate_frontier(self) -> None:
@@ -187,6 +208,9 @@ class Orchestrator(Component):
             if docid is None:
                 self.notfound_seedurls += 1
                 continue # skip
+
+            if self.SeenURLTester.is_seen_and_mark(docid): # mark the seed url as seen, skipping duplicated seeds
+                continue
             
             if not self.oracle: # add the seed url to the frontier with maximum priority
                 self.FrontierManager.add_with_max_priority(seed_url, docid)
@@ -207,7 +231,6 @@ class Orchestrator(Component):
                 self.FrontierManager.add(page, None)
 
             to_write.append(seed_url) # add see url to the list of urls to write to file.
-            self.SeenURLTester.mark_seen(docid) # mark the seed url as seen
 
         save_seeds(to_write, "seeds.txt") # save seed urls to file
         self.seed_urls = None
@@ -216,6 +239,10 @@ class Orchestrator(Component):
     def crawl(self) -> None:
         """
             Start the crawling process.
+            Pages are processed one at a time: downloads are simulated by in-memory lookups, so there is no I/O to overlap,
+            and each pop must see the outlinks enqueued by the previous page to follow the frontier's priority order.
+            Parsing is not offloaded to worker processes either: the decoded outlinks would have to be pickled back
+            to the main process, which costs about as much as decoding them in place.
         """
         self.failed_dowloads = 0
         self.wrong_linked_docid = 0
@@ -228,9 +255,15 @@ class Orchestrator(Component):
 
         # initialise progress bar
         total_pages = self.max_pages if self.max_pages > 0 else self.Fetcher.get_total_docs()
-        progress_bar = tqdm(total=total_pages, desc="Crawling", unit="page")
+        # the bar is redrawn at most every miniters pages and mininterval seconds, and disabled for silent runs
+        progress_bar = tqdm(total=total_pages, desc="Crawling", unit="page",
+                            miniters=max(1, self.save_every_n_pages // 10), mininterval=0.5, disable=(self.verbosity == 0))
         sys.stdout.flush()
 
+        # checkpoints are flushed by a background thread, at most one at a time
+        io_pool = ThreadPoolExecutor(max_workers=1)
+        checkpoint_future = None
+
         while self.FrontierManager.enqueued() > 0: # process the frontier until it becomes empty
             processed_pages = self.Fetcher.num_dowloaded()
 
@@ -238,8 +271,8 @@ class Orchestrator(Component):
                 self.log(f"Max pages limit of {self.max_pages} crawled pages reached.", 1)
                 break
 
-            url = self.FrontierManager.pop() # get next url to be processed from the frontier
-            page = self.Fetcher.download(url) # download the page
+            docno = self.FrontierManager.pop() # get next docno to be processed from the frontier
+            page = self.Fetcher.download_docno(docno) # download the page
 
             if page is None: # check if the download has failed
                 self.failed_dowloads += 1
@@ -256,11 +289,16 @@ class Orchestrator(Component):
                 self.log(f"\t{self.notfound_seedurls} not found seed urls", 1)
                 self.log(f"\t{self.num_noutlinks} pages with no outlinks.", 1)
                 self.log(f"Storing {processed_pages} downloaded pages to file.", 1)
-                self.Fetcher.checkpoint()
-            sys.stdout.flush()
+                if checkpoint_future is not None:
+                    checkpoint_future.result() # wait for the previous checkpoint
+                checkpoint_future = io_pool.submit(self.Fetcher.checkpoint)
+                sys.stdout.flush()
 
         # save the downloaded pages to file
 
+        io_pool.shutdown(wait=True)
+        if checkpoint_future is not None:
+            checkpoint_future.result() # propagate errors of the last checkpoint
         progress_bar.close()
         if self.FrontierManager.enqueued() == 0:
             self.log(f"Frontier is empty.", 1)
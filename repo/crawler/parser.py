@@ -1,5 +1,10 @@
 
 import sys, os
+import numpy as np
+from functools import partial
+from itertools import islice
+from operator import itemgetter, ne
+from typing import Iterable
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
@@ -20,12 +25,14 @@ SLEEP_INTERVAL = 0.5
 
 QSCORER_CHECKPOINT = "qt5-small-ft"
 
+QSCORES_BATCH_SIZE = 1 << 16 # number of documents whose quality scores are looked up at once
+
 class Parser(Component):
     """
         Class of the parser component.
         It parses the metadata of the downloaded pages, including outlinks, inlinks and quality score.
     """  
-    def __init__(self, collection: str, to_parse: list =  [], verbose: bool = False) -> None:
+    def __init__(self, collection: str, to_parse: list =  [], verbose: bool = False, dedup_outlinks: bool = True) -> None:
         """
             Constructor of the parser
             
@@ -33,6 +40,7 @@ class Parser(Component):
                 collection: string identifier of the collection
                 to_parse: list of strings with the metadata to parse
                 verbose: boolean flag to print log messages
+                dedup_outlinks: boolean flag to deduplicate outlinks by url (callers that map outlinks to docnos can dedup on ints instead)
         """
         Component.__init__(self, verbose)
         self.component_name = "PARSER"
@@ -40,13 +48,17 @@ class Parser(Component):
         self.log(f"Initialising parser for {collection} collection.")
         self.to_parse = to_parse
         self.log(f"Metadata to parse={self.to_parse}.")
+        self.dedup_outlinks = dedup_outlinks
 
         collection_config = COLLECTIONS[collection]
         self.inlinks_dir = collection_config["inlinks_dir"]
         self.outlinks_dir = collection_config["outlinks_dir"]
+        self.intern_urls = collection_config.get("intern_urls", False) # intern outlinks to match the interned url2docnos keys by identity
        
         self.log(f"Out-Links will be read from directory={self.outlinks_dir}.")
 
+        self.qscores_table = None # dense quality scores indexed by docno, built on demand
+
         if "qscores" in self.to_parse:
             self.log(f"Initialising QScorer from checkpoint {QSCORER_CHECKPOINT}.")
             self.QScorer = QualityScorer(checkpoint=QSCORER_CHECKPOINT, collection=collection, verbose=True)
@@ -67,10 +79,10 @@ class Parser(Component):
         """
 
         metadata = {}
-        metadata["outlinks"] = self.__parse_outlinks(page)
+        metadata["outlinks"] = self.__parse_outlinks(page.get_id(), page.get_url())
         
         if "qscores" in self.to_parse:    
-            qscore = self.__parse_qscore(page)
+            qscore = self.__parse_qscore(page.get_id(), page.get_docno())
             metadata["qscore"] = qscore
         if "inlinks" in self.to_parse:
             inlinks = self.parse_num_inlinks(page)
@@ -80,40 +92,43 @@ class Parser(Component):
         return page
     
 
-    def clean_links(self, links: list, url: str) -> list:
+    def clean_links(self, links: list, url: str, dedup: bool = True) -> list:
         """
             Remove self-links and external links (i.e., links that are not in the collection) from the list of links.
+            Links are interned if intern_urls is enabled for the collection.
 
             Args:
                 links: list of links to be cleaned
                 url: url of the document that contains the links
+                dedup: boolean flag to remove duplicate links
         """
-        cleaned_links = []
-
-        for link in links:
-            link_url = link[URL_INDEX]
-            if (link_url != url) and (link_url not in cleaned_links):
-                cleaned_links.append(link_url)
-        return cleaned_links
-
-    def __parse_outlinks(self, page: WebPage) -> list:
+        # map/filter with builtin callables run the per-link loop without executing bytecode
+        link_urls = map(itemgetter(URL_INDEX), links)
+        if self.intern_urls:
+            link_urls = map(sys.intern, link_urls)
+        link_urls = filter(partial(ne, url), link_urls)
+        if not dedup:
+            return list(link_urls)
+        # dict.fromkeys deduplicates in a single pass while preserving the order of first occurrence
+        return list(dict.fromkeys(link_urls))
+
+    def __parse_outlinks(self, docid: str, url: str) -> list:
         """
-            Extract the outlinks of a given WebPage object and return them as a list of strings.
+            Extract the outlinks of a given document and return them as a list of strings.
 
             Args: 
-                page: WebPage object of the page for which outlinks should be extracted
+                docid: identifier of the document for which outlinks should be extracted
+                url: url of the document, used to remove self-links
         """
         outlinks = []
-        id = page.get_id()
-        url = page.get_url()
 
-        doc_data = navigate_to_id(self.outlinks_dir, id)
+        doc_data = navigate_to_id(self.outlinks_dir, docid)
         if doc_data is None:
             return None
         raw_outlinks = doc_data['outlinks']
 
         if raw_outlinks is not None:
-            outlinks = self.clean_links(raw_outlinks, url)
+            outlinks = self.clean_links(raw_outlinks, url, dedup=self.dedup_outlinks)
 
         return outlinks
 
@@ -126,7 +141,18 @@ class Parser(Component):
             Args:
                 page: WebPage object of the page for which outlinks should be extracted
         """
-        return self.__parse_outlinks(page)
+        return self.__parse_outlinks(page.get_id(), page.get_url())
+
+    def parse_outlinks_by_id(self, docid: str, url: str) -> list:
+        """
+            Extract the outlinks of a document given its docid and url, without building a WebPage object.
+            This function wraps the internal implementation.
+
+            Args:
+                docid: identifier of the document for which outlinks should be extracted
+                url: url of the document, used to remove self-links
+        """
+        return self.__parse_outlinks(docid, url)
 
     
     def __parse_inlinks(self, page: WebPage) -> float:
@@ -182,14 +208,35 @@ class Parser(Component):
         """
         return self.__parse_numinlinks(page)
 
-    def __parse_qscore(self, page: WebPage) -> float:
+    def build_qscore_table(self, docids: Iterable[str], num_docs: int) -> np.ndarray:
         """
-            Extract the quality score of a given WebPage object and return it as a float.
+            Look up the quality scores of all the documents once and store them in a float32 array indexed by docno.
+            Documents without a quality score are stored as NaN. Later lookups by docno read the table.
 
             Args:
-                page: WebPage object of the page for which the quality score should be extracted
+                docids: iterable of the docids of the collection, in docno order
+                num_docs: number of documents in the collection
         """
-        docid = page.get_id()
+        self.log(f"Building quality scores table for {num_docs} documents.")
+        self.qscores_table = np.full(num_docs, np.nan, dtype=np.float32)
+        docids = iter(docids)
+        # scores are looked up in batches, each with a single binary search over the docnos of the scorer
+        for start in range(0, num_docs, QSCORES_BATCH_SIZE):
+            batch = list(islice(docids, QSCORES_BATCH_SIZE))
+            self.qscores_table[start:start + len(batch)] = self.QScorer.get_scores_array(batch)
+        return self.qscores_table
+
+    def __parse_qscore(self, docid: str, docno: int | None = None) -> float:
+        """
+            Extract the quality score of a given document and return it as a float.
+
+            Args:
+                docid: identifier of the document for which the quality score should be extracted
+                docno: docno of the document, used to read the quality scores table if available
+        """
+        if (self.qscores_table is not None) and (docno is not None):
+            qscore = self.qscores_table[docno]
+            return None if np.isnan(qscore) else float(qscore)
         return self.QScorer.get_score(docid)
     
     def parse_qscore(self, page: WebPage) -> float:
@@ -200,8 +247,21 @@ class Parser(Component):
             Args:
                 page: WebPage object of the page for which the quality score should be extracted
         """
-        return self.__parse_qscore(page)
-        
+        return self.__parse_qscore(page.get_id(), page.get_docno())
+
+    def parse_qscore_batch(self, docids: list, docnos: list | None = None) -> list:
+        """
+            Extract the quality scores of a batch of documents and return them as a list of floats (None for missing scores).
+
+            Args:
+                docids: list of identifiers of the documents
+                docnos: list of docnos of the documents, used to gather from the quality scores table if available
+        """
+        if (self.qscores_table is not None) and (docnos is not None):
+            qscores = self.qscores_table[np.asarray(docnos, dtype=np.int64)].tolist()
+            return [None if qscore != qscore else qscore for qscore in qscores] # NaN marks missing scores
+        return self.QScorer.get_scores(docids)
+
     def log(self, msg: str) -> None:
         """
             Print a log message with the component name.
@@ -8,7 +8,7 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from utils.config import config
 from utils.component import Component
 from utils.datasetIR import load_collection_url2ids_mappings, load_url2docids
-from utils.utils import yield_initial_seeds
+from utils.utils import yield_initial_seeds, sample_keys
 
 
 COLLECTIONS = config.get('collections', None)
@@ -72,7 +72,7 @@ class RandomSeedsGenerator(Component):
         if n > self.total_docs:
             raise ValueError(f"Number of seed URLs requested exceeds {self.total_docs}.")
         
-        sampled_urls = random.sample(list(self.__url2docids.keys()), n)
+        sampled_urls = sample_keys(self.__url2docids, n) # sample without copying all the keys
 
         for url in sampled_urls:
             yield url
@@ -101,11 +101,10 @@ class ListSeedsGenerator(Component):
         self.log(f"Initialising url2docids mapping from file={self.url2docids_fpath}.")
         url2docid = load_url2docids(self.url2docids_fpath)
 
-        self.__docid2url = {v: k for k, v in url2docid.items()}
+        # only the size of the collection is needed to validate requests, the mapping is not kept nor inverted
+        self.total_docs = len(url2docid)
 
         del url2docid
-    
-        self.total_docs = len(self.__docid2url)
 
         self.init_seeds_fpath = COLLECTIONS[collection]["init_seeds_fpath"]["best"]
         
@@ -1,4 +1,5 @@
 import sys, os
+import math
 from abc import ABC, abstractmethod
 
 from bitarray import bitarray
@@ -38,6 +39,37 @@ class SeenURLTester(ABC):
         """
         pass
 
+    def is_seen_batch(self, docids: list) -> list:
+        """
+            Check if each url of a list is already seen
+
+            Args:
+                docids: list of docids to test
+        """
+        return [self.is_seen(docid) for docid in docids]
+
+    def is_seen_and_mark(self, docid: int) -> bool:
+        """
+            Mark a url as seen and return whether it was already seen
+
+            Args:
+                docid: docid to test and mark as seen
+        """
+        seen = self.is_seen(docid)
+        if not seen:
+            self.mark_seen(docid)
+        return seen
+
+    def mark_seen_batch(self, docids: list) -> None:
+        """
+            Mark each url of a list as seen
+
+            Args:
+                docids: list of docids to mark as seen
+        """
+        for docid in docids:
+            self.mark_seen(docid)
+
     def __repr__(self):
         """
             Return the name of the class
@@ -112,6 +144,7 @@ class BitArraySeenURLTester(SeenURLTester):
         self.capacity = capacity
         self.seen_urls = bitarray(self.capacity)
         self.seen_urls.setall(0)
+        self.num_seen = 0 # running count of set bits, so that seen_count does not scan the bitarray
 
 
     def is_seen(self, docid: int) -> bool:
@@ -119,10 +152,10 @@ class BitArraySeenURLTester(SeenURLTester):
             Check if a url is already seen
 
             Args:
-                docid: docid to test
+                docid: docid to test (indexes beyond capacity raise IndexError)
         """
-        if docid >= self.capacity or docid < 0:
-            raise IndexError(f"Error: docid={docid} out of range (capacity={self.capacity}).")
+        if docid < 0: # bitarray would silently wrap negative indexes around
+            raise IndexError(f"Error: docid={docid} must be non-negative.")
         return self.seen_urls[docid]
         
     def mark_seen(self, docid: int) -> None:
@@ -130,19 +163,143 @@ class BitArraySeenURLTester(SeenURLTester):
             Mark a docid as seen
 
             Args:
-                docid: docid to mark as seen
+                docid: docid to mark as seen (indexes beyond capacity raise IndexError)
+        """
+        if docid < 0: # bitarray would silently wrap negative indexes around
+            raise IndexError(f"Error: docid={docid} must be non-negative.")
+        if not self.seen_urls[docid]:
+            self.seen_urls[docid] = 1
+            self.num_seen += 1
+
+    def is_seen_and_mark(self, docid: int) -> bool:
         """
-        if docid >= self.capacity or docid < 0:
-            raise IndexError(f"Error: docid={docid} out of range (capacity={self.capacity}).")
-        self.seen_urls[docid] = 1
+            Mark a docid as seen and return whether it was already seen
+
+            Args:
+                docid: docid to test and mark as seen (indexes beyond capacity raise IndexError)
+        """
+        if docid < 0: # bitarray would silently wrap negative indexes around
+            raise IndexError(f"Error: docid={docid} must be non-negative.")
+        seen_urls = self.seen_urls
+        seen = seen_urls[docid]
+        if not seen:
+            seen_urls[docid] = 1
+            self.num_seen += 1
+        return seen
 
     def seen_count(self) -> int:    
         """
             Return the number of seen urls
         """
-        return self.seen_urls.count(1)
+        return self.num_seen
+
+    def is_seen_batch(self, docids: list) -> list:
+        """
+            Check if each url of a list is already seen
+
+            Args:
+                docids: list of docnos to test, as returned by the fetcher (not checked for negative values, which bitarray would wrap around)
+        """
+        seen_urls = self.seen_urls
+        return [seen_urls[docid] for docid in docids]
+
+    def mark_seen_batch(self, docids: list) -> None:
+        """
+            Mark each url of a list as seen
+
+            Args:
+                docids: list of docnos to mark as seen, as returned by the fetcher (not checked for negative values, which bitarray would wrap around)
+        """
+        seen_urls = self.seen_urls
+        num_new = 0
+        for docid in docids:
+            if not seen_urls[docid]:
+                seen_urls[docid] = 1
+                num_new += 1
+        self.num_seen += num_new
     
 
+class BloomSeenURLTester(SeenURLTester):
+    """
+        Class to test if a url is already seen using a Bloom filter over a bitarray.
+        Memory is bounded by the expected number of urls, at the cost of a small false positive rate (never false negatives).
+    """
+    name = "BloomSeenURLTester"
+
+    default_capacity = 1_000_000
+    MASK64 = (1 << 64) - 1
+
+    def __init__(self, capacity: int = default_capacity, fpr: float = 1e-4) -> None:
+        """
+            Constructor of the class
+            
+            Args:
+                capacity: expected number of urls to mark as seen
+                fpr: target false positive rate at capacity
+        """
+        super().__init__()
+        if not (0 < fpr < 1):
+            raise ValueError(f"Error: fpr={fpr} must be in (0, 1).")
+        self.capacity = max(capacity, 1)
+        self.num_bits = math.ceil(-self.capacity * math.log(fpr) / (math.log(2) ** 2))
+        self.num_hashes = max(1, round((self.num_bits / self.capacity) * math.log(2)))
+        self.bits = bitarray(self.num_bits)
+        self.bits.setall(0)
+        self.num_seen = 0
+
+    def _mix(self, x: int) -> int:
+        """
+            SplitMix64 finaliser, used to hash docids to 64-bit integers.
+        """
+        x = (x + 0x9E3779B97F4A7C15) & self.MASK64
+        x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & self.MASK64
+        x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & self.MASK64
+        return x ^ (x >> 31)
+
+    def _positions(self, docid: int) -> list:
+        """
+            Return the bit positions of a docid, using double hashing.
+
+            Args:
+                docid: docid to hash
+        """
+        h1 = self._mix(docid)
+        h2 = self._mix(h1) | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def is_seen(self, docid: int) -> bool:
+        """
+            Check if a url is already seen
+
+            Args:
+                docid: docid to test
+        """
+        bits = self.bits
+        return all(bits[pos] for pos in self._positions(docid))
+        
+    def mark_seen(self, docid: int) -> None:
+        """
+            Mark a docid as seen
+
+            Args:
+                docid: docid to mark as seen
+        """
+        new = False
+        bits = self.bits
+        for pos in self._positions(docid):
+            if not bits[pos]:
+                bits[pos] = 1
+                new = True
+        if new:
+            self.num_seen += 1
+
+    def seen_count(self) -> int:    
+        """
+            Return the (approximate) number of seen urls
+        """
+        return self.num_seen
+
+
 def init_url_seen_tester(tester_type: str, capacity: int = None):
     """
         Initialises a seen url tester of the specified type.
@@ -155,5 +312,7 @@ def init_url_seen_tester(tester_type: str, capacity: int = None):
         return SetSeenURLTester(capacity=capacity)
     elif tester_type == "bitarray":
         return BitArraySeenURLTester(capacity=capacity)
+    elif tester_type == "bloom":
+        return BloomSeenURLTester(capacity=capacity)
     else:
         raise ValueError(f"Error: type={tester_type} not supported.")
\ No newline at end of file
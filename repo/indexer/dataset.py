@@ -1,12 +1,19 @@
 import sys, os
+import heapq
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
 import pandas as pd
-import pyterrier as pt
+import ir_measures
 from pandas import DataFrame
+try:
+    import pyarrow # enables the multi-threaded csv reader of pandas
+except ImportError:
+    pyarrow = None
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 
-from utils.datasetIR import load_collection_docnos_mappings, load_downloaded_list, load_queries, load_qrels
+from utils.datasetIR import load_collection_docnos_mappings, load_downloaded_list, load_queries, load_qrels, parse_docids2docnos
 from utils.config import config
 from utils.utils import navigate_to_id
 from utils.preprocessor import Preprocessor
@@ -23,6 +30,18 @@ BENCHMARKS = config.get('evaluation_benchmarks', None)
 QRELS_DIR = config.get('paths').get('qrels_dir')
 QUERIES_DIR = config.get('paths').get('queries_dir')
 
+PREFETCH_BATCH_SIZE = 512 # number of documents read ahead by the prefetching threads
+PREPROCESS_CHUNKSIZE = 64 # number of documents sent at once to a preprocessing worker
+
+
+def preprocess_documents(texts: list, executor: ProcessPoolExecutor | None = None) -> list:
+    """
+        Preprocess a list of document texts, in parallel if an executor is given, preserving their order
+    """
+    if executor is None:
+        return [Preprocessor.process_document(text) for text in texts]
+    return list(executor.map(Preprocessor.process_document, texts, chunksize=PREPROCESS_CHUNKSIZE))
+
 
 def load_queries_from_dataset(benchmark_name: str):
     """
@@ -41,7 +60,7 @@ class Downloads:
         Class to handle the dataset of downloaded pages of a specific collection like ClueWeb22-B, by a specified crawler
     """
 
-    def __init__(self, collection: str, verbose: bool = False) -> None:
+    def __init__(self, collection: str, verbose: bool = False, num_threads: int = 16, num_workers: int = 1) -> None:
         """
             Initialise the dataset of downloads related to a specific collection
         """
@@ -53,7 +72,10 @@ class Downloads:
         self.texts_dir = COLLECTIONS[collection]['texts_dir']
         self.collection = collection
         self.num_loaded = 0
-        self.docno2urls, self.docno2docids = load_collection_docnos_mappings(self.url2docids_fpath)
+        self.num_threads = num_threads
+        self.num_workers = num_workers # processes used to preprocess the texts
+        self.text_field = COLLECTIONS[self.collection]['text_key']
+        self.docno2urls, self.docno2docids = load_collection_docnos_mappings(self.url2docids_fpath, mmap=COLLECTIONS[collection].get('mmap_url2docids', False))
 
     def set_numloaded(self, num_loaded) -> None:
         """
@@ -79,6 +101,18 @@ class Downloads:
         """
         return self.docno2docids.get(docno, None)
 
+    def docids2docnos(self, docids: list) -> np.ndarray:
+        """
+            Get the array of docnos associated to a list of docids (-1 for docids not in the collection)
+        """
+        return parse_docids2docnos(docids, self.docno2docids)
+
+    def get_numdocs(self) -> int:
+        """
+            Get the number of documents in the collection
+        """
+        return len(self.docno2docids)
+
 
     def load_downloads(self, data_dir: str, preprocess: bool, limit: int = None) -> Iterator[Dict]:
         """
@@ -91,23 +125,48 @@ class Downloads:
             print(f"Downloaded {len(downloaded_docnos)} docnos.")
         self.set_numloaded(len(downloaded_docnos))
 
-        text_field = COLLECTIONS[self.collection]['text_key']
         skipped_docs = 0
-        for docno in downloaded_docnos:
-            docid = self.docno2docid(docno)
-            text = navigate_to_id(self.texts_dir, docid)[text_field]
-            if preprocess:
-                text = Preprocessor.process_document(text)
-                if text is None:
-                    skipped_docs +=1
-                    continue
-            yield {"docno": docid, "text": text} # format required by pyterrier_pisa 
+        starts = range(0, len(downloaded_docnos), PREFETCH_BATCH_SIZE)
+        pool = ProcessPoolExecutor(max_workers=self.num_workers) if (preprocess and self.num_workers > 1) else None
+        try:
+            with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+                next_batch = self._prefetch(executor, downloaded_docnos[:PREFETCH_BATCH_SIZE])
+                for start in starts:
+                    # texts of the next batch are read by the threads while the current batch is yielded
+                    batch = next_batch
+                    next_start = start + PREFETCH_BATCH_SIZE
+                    next_batch = self._prefetch(executor, downloaded_docnos[next_start:next_start + PREFETCH_BATCH_SIZE])
+                    texts = [future.result() for _, future in batch]
+                    if preprocess:
+                        texts = preprocess_documents(texts, pool)
+                    for (docid, _), text in zip(batch, texts):
+                        if preprocess and text is None:
+                            skipped_docs +=1
+                            continue
+                        yield {"docno": docid, "text": text} # format required by pyterrier_pisa 
+        finally:
+            if pool is not None:
+                pool.shutdown()
         print(f"Skipped {skipped_docs} documents due to text=None.")
 
+    def _read_text(self, docid: str) -> str:
+        """
+            Read the text of a document given its docid
+        """
+        return navigate_to_id(self.texts_dir, docid)[self.text_field]
+
+    def _prefetch(self, executor: ThreadPoolExecutor, docnos: list) -> list:
+        """
+            Submit the reads of the texts of a batch of docnos to the executor.
+            Returns the list of (docid, future of the text) pairs, in the order of the docnos.
+        """
+        docids = [self.docno2docid(docno) for docno in docnos]
+        return [(docid, executor.submit(self._read_text, docid)) for docid in docids]
+
     
-    def load_downloads_docnos(self, data_dir: str, limit: int = None) -> list:
+    def load_downloads_docnos(self, data_dir: str, limit: int = None) -> np.ndarray:
         """
-            Load downloaded docnos stored in data_dir eventually with their texts
+            Load downloaded docnos stored in data_dir eventually with their texts, as a numpy array
         """
         if self.verbose:
             print(f"Loading {limit} data from dir = {data_dir}.")
@@ -145,7 +204,7 @@ class ClueWeb22:
         self.texts_dir = COLLECTIONS[collection]['texts_dir']
         self.collection = collection
         self.num_loaded = 0
-        self.docno2urls, self.docno2docids = load_collection_docnos_mappings(self.url2docids_fpath)
+        self.docno2urls, self.docno2docids = load_collection_docnos_mappings(self.url2docids_fpath, mmap=COLLECTIONS[collection].get('mmap_url2docids', False))
         self.text_field = COLLECTIONS[self.collection]['text_key']
     
     def docno2url(self, docno: int) -> str:
@@ -193,7 +252,7 @@ class RankingListDataframe:
     """
         Class to handle ranking lists stored in TREC format (run files)
     """
-    def __init__(self, collection: str, run_fpath: str, topk: int, preprocess=True, verbose: bool = False) -> None:
+    def __init__(self, collection: str, run_fpath: str, topk: int, preprocess=True, verbose: bool = False, num_workers: int = 1, num_threads: int = 16) -> None:
         self.verbose = verbose
         if self.verbose:
             print(f"Initialising ranking list dataset for {collection} collection, with topk={topk}.")
@@ -204,6 +263,8 @@ class RankingListDataframe:
         self.topk = topk
         self.text_field = COLLECTIONS[self.collection]['text_key']
         self.preprocess = preprocess
+        self.num_workers = num_workers # processes used to preprocess the texts
+        self.num_threads = num_threads # threads used to read the texts
 
     def get_rankings(self, benchmark: str, load_texts=True):
         """
@@ -211,13 +272,10 @@ class RankingListDataframe:
         """
         if self.verbose:
             print(f"Loading {self.topk} from ranking lists stored at {self.run_fpath}.")
-        results_df = pt.io.read_results(self.run_fpath, format="trec")
-       
-        results_df = results_df.sort_values(by=['qid', 'score'], ascending=[True, False])
-        results_df = results_df.groupby('qid').head(self.topk)
+        results_df = self._read_topk_run()
 
         if load_texts:
-            unique_docnos = results_df['docno'].unique().tolist()
+            unique_docnos = pd.unique(results_df['docno'].to_numpy())
             results_df = self._load_doc_texts(results_df, unique_docnos)
 
             results_df = self._load_query_texts(results_df, benchmark)
@@ -226,25 +284,79 @@ class RankingListDataframe:
 
         return results_df
 
+    def _read_topk_run(self) -> DataFrame:
+        """
+            Read the run file keeping only the top k documents of each query, with the pyarrow csv reader if available.
+            Returns the dataframe of the kept rows sorted by qid and decreasing score.
+        """
+        if pyarrow is not None:
+            try:
+                return self._read_topk_run_pyarrow()
+            except ValueError as e: # e.g., mixed or repeated separators, that the single-character pyarrow separator cannot split
+                print(f"Warning: falling back to the streaming run reader, since the pyarrow reader failed with: {e}")
+        return self._stream_topk_run()
+
+    def _read_topk_run_pyarrow(self) -> DataFrame:
+        """
+            Parse the whole run file with the multi-threaded pyarrow csv reader, then select the top k documents of each query.
+            Raises ValueError if the file cannot be split into the six columns of a TREC run with the separator of its first line.
+        """
+        with open(self.run_fpath, 'r') as f:
+            sep = '\t' if '\t' in f.readline() else ' ' # the pyarrow engine only supports single-character separators
+        results_df = pd.read_csv(self.run_fpath, sep=sep, header=None, engine='pyarrow',
+                                 names=['qid', 'Q0', 'docno', 'rank', 'score', 'run'],
+                                 dtype={'qid': str, 'docno': str, 'score': 'float64'})
+        if results_df.shape[1] != 6 or results_df.isna().any(axis=None): # rows with missing fields were not split as expected
+            raise ValueError(f"Error: run file={self.run_fpath} does not have 6 columns separated by sep={sep!r}.")
+
+        # nlargest keeps the earliest documents on ties, and the stable sort preserves that order
+        topk_index = results_df.groupby('qid')['score'].nlargest(self.topk).index.get_level_values(-1)
+        results_df = results_df.loc[topk_index, ['qid', 'docno', 'score']]
+        results_df = results_df.sort_values(by=['qid', 'score'], ascending=[True, False], kind='stable')
+        return results_df.astype({'score': 'float32'}) # downcast after sorting, so ties are not affected
+
+    def _stream_topk_run(self) -> DataFrame:
+        """
+            Stream the run file with the same parser used for evaluation, keeping only the top k documents of each query.
+        """
+        topk_heaps = {} # min-heap of (score, -position, docno) of the best documents of each query
+        for position, scored_doc in enumerate(ir_measures.read_trec_run(self.run_fpath)):
+            heap = topk_heaps.setdefault(scored_doc.query_id, [])
+            entry = (scored_doc.score, -position, scored_doc.doc_id) # ties keep the earliest documents
+            if len(heap) < self.topk:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+        rows = [(qid, docno, score, -neg_position) for qid, heap in topk_heaps.items() for score, neg_position, docno in heap]
+        results_df = pd.DataFrame(rows, columns=['qid', 'docno', 'score', 'position'])
+        results_df = results_df.sort_values(by=['qid', 'score', 'position'], ascending=[True, False, True])
+        return results_df.drop(columns='position').astype({'score': 'float32'}) # downcast after sorting, so ties are not affected
+
+    def _read_text(self, docno: str) -> str:
+        """
+            Read the text of a document given its docno
+        """
+        return navigate_to_id(self.texts_dir, docno)[self.text_field]
+
     def _load_doc_texts(self, df: DataFrame, docnos: list):
         """
-            Load the texts of the documents given their docnos
+            Load the texts of the documents given their (unique) docnos, reading them with a pool of threads
         """
-        doc_texts = [] 
-        
-        cleaned_docnos = []
-        for docno in docnos:
-            text = navigate_to_id(self.texts_dir, docno)[self.text_field]
-            if self.preprocess:
-                text = Preprocessor.process_document(text)
-            if text is None:
-                continue
-            cleaned_docnos.append(docno)
-            doc_texts.append(text)
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            texts = list(executor.map(self._read_text, docnos))
+        if self.preprocess:
+            if self.num_workers > 1:
+                with ProcessPoolExecutor(max_workers=self.num_workers) as pool:
+                    texts = preprocess_documents(texts, pool)
+            else:
+                texts = preprocess_documents(texts)
 
-        doc_texts_df = pd.DataFrame({'docno': cleaned_docnos, 'text': doc_texts})
+        doc_texts = [(docno, text) for docno, text in zip(docnos, texts) if text is not None]
+        doc_texts_df = pd.DataFrame(doc_texts, columns=['docno', 'text']).drop_duplicates('docno')
 
-        results_df = df.merge(doc_texts_df, on='docno', how='right') # TODO: change it to 'left
+        # hash join on the docno index, documents without text are dropped
+        results_df = df.set_index('docno').join(doc_texts_df.set_index('docno'), how='inner').reset_index()
 
         assert results_df['text'].isna().sum() == 0, f"Error: number of NaN values in documents' text: {results_df['text'].isna().sum() == 0}"
         return results_df
@@ -253,8 +365,8 @@ class RankingListDataframe:
         """
             Load the texts of the queries given their qids
         """
-        queries_df = load_queries_from_dataset(benchmark_name)
-        results_df = df.merge(queries_df, on='qid', how='inner') # TODO: change it to 'left' 
+        queries_df = load_queries_from_dataset(benchmark_name).drop_duplicates('qid')
+        results_df = df.set_index('qid').join(queries_df.set_index('qid'), how='inner').reset_index() # TODO: change it to 'left' 
         assert results_df['query'].isna().sum() == 0, f"Error: number of NaN values in queries' text: {results_df['query'].isna().sum() == 0}"
         assert results_df['docno'].isna().sum() == 0, f"Error: number of NaN values in docnos: {results_df['docno'].isna().sum() == 0}"
         
@@ -278,6 +390,7 @@ class MSMarcoWebSearch:
         self.queries_fpath = QUERIES_DIR + f"{benchmark}/" + BENCHMARKS[benchmark]['queries_file']       
 
         self.subset = subset
+        self.qrels_df = None # qrels dataframe, loaded on first use
 
     def get_queries(self, judged: bool = True) -> DataFrame:
         """
@@ -286,10 +399,10 @@ class MSMarcoWebSearch:
         if self.verbose:
             print(f"Loading queries from file={self.queries_fpath}.")
         self.queries = load_queries(self.queries_fpath)
-        df = pd.DataFrame(self.queries)
-        if judged:
-            qrels_rel = self.get_qrels()
-            df = df[df.qid.isin(qrels_rel['query_id'])]
+        queries = self.queries
+        if judged: # keep the judged queries only
+            queries = queries[queries['qid'].isin(set(self.get_qrels()['query_id']))]
+        df = queries.reset_index(drop=True) # a new frame, the loaded queries are shared
         if self.verbose:
             print(f"Loaded {len(self.queries)} queries.")
        
@@ -301,16 +414,17 @@ class MSMarcoWebSearch:
 
     def get_qrels(self) -> DataFrame:
         """
-            Load the qrels of the query set
+            Load the qrels of the query set, once per instance
         """
+        if self.qrels_df is not None:
+            return self.qrels_df
         if self.verbose:
             print(f"Loading qrels from file={self.qrels_fpath}.")
         self.qrles = load_qrels(self.qrels_fpath)
         if self.verbose:
             print(f"Loaded {len(self.qrles)} qrels.")
-        df = pd.DataFrame(self.qrles)
-        
-        return df
+        self.qrels_df = self.qrles.copy() # a copy owned by this instance, the loaded qrels are shared
+        return self.qrels_df
 
     def get_relevant(self) -> DataFrame:
         """
@@ -343,17 +457,18 @@ class ResearchyQuestions:
 
         self.qrels_fpath = QRELS_DIR + f"{benchmark}/" + BENCHMARKS[benchmark]['qrels_file']
         self.queries_fpath = QUERIES_DIR + f"{benchmark}/" + BENCHMARKS[benchmark]['queries_file']  
-        self.subset = subset     
+        self.subset = subset
+        self.qrels_df = None # qrels dataframe, loaded on first use
 
     def get_queries(self, judged=True) -> DataFrame:
         """
             Load the queries of the dataset (or a subsample of them)
         """
         self.queries = load_queries(self.queries_fpath)
-        df = pd.DataFrame(self.queries)
-        if judged:
-            qrels_rel = self.get_qrels()
-            df = df[df.qid.isin(qrels_rel['query_id'])]
+        queries = self.queries
+        if judged: # keep the judged queries only
+            queries = queries[queries['qid'].isin(set(self.get_qrels()['query_id']))]
+        df = queries.reset_index(drop=True) # a new frame, the loaded queries are shared
 
         if self.subset is not None:
             df = df.sample(n=self.subset, random_state=RANDOM_SEED)
@@ -363,15 +478,17 @@ class ResearchyQuestions:
 
     def get_qrels(self) -> DataFrame:
         """
-            Load the qrels of the query set
+            Load the qrels of the query set, once per instance
         """
+        if self.qrels_df is not None:
+            return self.qrels_df
         if self.verbose:
             print(f"Loading qrels from file={self.qrels_fpath}.")
         self.qrles = load_qrels(self.qrels_fpath)
         if self.verbose:
             print(f"Loaded {len(self.qrles)} qrels.")
-        df = pd.DataFrame(self.qrles)
-        return df
+        self.qrels_df = self.qrles.copy() # a copy owned by this instance, the loaded qrels are shared
+        return self.qrels_df
     
     def get_relevant(self) -> DataFrame:
         """
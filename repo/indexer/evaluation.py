@@ -3,6 +3,7 @@ from typing import List
 import ir_measures
 from ir_measures import nDCG, MRR, R
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
@@ -71,33 +72,36 @@ def perform_evaluation(run_path: str, benchmark_name: str, experiment_name: str,
     else:
         results_dict = {}
         for result in tqdm(results, desc=f"Computing IR metrics on {benchmark_name}"):
-            if result.query_id not in results_dict:
-                results_dict[result.query_id] = {f"{result.measure}": result.value}
-            else:
-                results_dict[result.query_id][f"{result.measure}"] = result.value
-
-            df = pd.DataFrame.from_dict(results_dict).T
-            df = df.reset_index()
-            df = df.rename(columns={'index': 'qid'})
+            results_dict.setdefault(result.query_id, {})[f"{result.measure}"] = result.value
+
+        # build the dataframe once, after all the per-query metrics have been collected
+        df = pd.DataFrame.from_dict(results_dict, orient='index').rename_axis('qid').reset_index()
     return df
 
 """
     Evaluate multiple runs and return the aggregated metrics in a table format.
+    Runs are evaluated in parallel by a pool of processes, and their metrics are concatenated in the order of run_paths.
 """
 def evaluate_multiple_runs(run_paths: list, run_names: list, benchmark_name: str): 
     df_concat = []
 
-    for run_path, run_name in zip(run_paths, run_names):        
-        try:
-            df = perform_evaluation(run_path, benchmark_name, run_name)
-        except Exception as e:
-            print(f"Error: {e}")
-            print(f"Error in {benchmark_name}")
-            print(f"Error in {run_path}")
-            print(f"Error in {run_name}")
-            return None
-        df["run"] = run_name
-        df_concat.append(df)
+    max_workers = max(1, min(len(run_paths), os.cpu_count() or 1))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(perform_evaluation, run_path, benchmark_name, run_name) for run_path, run_name in zip(run_paths, run_names)]
+
+        for future, run_path, run_name in zip(futures, run_paths, run_names):
+            try:
+                df = future.result()
+            except Exception as e:
+                print(f"Error: {e}")
+                print(f"Error in {benchmark_name}")
+                print(f"Error in {run_path}")
+                print(f"Error in {run_name}")
+                for pending in futures:
+                    pending.cancel()
+                return None
+            df["run"] = run_name
+            df_concat.append(df)
         
     # concat all the dataframes for printing
     results = pd.concat(df_concat)
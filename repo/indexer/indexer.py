@@ -1,4 +1,5 @@
 import sys, os
+import shutil
 import datetime
 from pandas import DataFrame
 import pyterrier as pt
@@ -25,14 +26,15 @@ RUNS_DIR = config.get("paths").get("runs_dir")
 BATCH_SIZE = indexer_cfg.get("batch_size", 100000)
 NUM_THREADS = indexer_cfg.get("threads", 16)
 TOPK = indexer_cfg.get("topk", 100)
+WRITE_CHUNK_SIZE = 100_000 # number of result lines formatted per write
 
 
 """
     Get the iterator of first {num_docs} for the list of crawled/downloaded pages given the collection name, and the downloaded pages directory.
 """
-def get_downloads_iterator(collection: str, downloaded_pages_dir: str, num_docs_limit: int, preprocess: bool):
+def get_downloads_iterator(collection: str, downloaded_pages_dir: str, num_docs_limit: int, preprocess: bool, num_threads: int = NUM_THREADS):
     is_lim_reached = False
-    downloaded_dataset = Downloads(collection)
+    downloaded_dataset = Downloads(collection, num_threads=num_threads)
     docs_iterator = downloaded_dataset.load_downloads(downloaded_pages_dir, limit=num_docs_limit, preprocess=preprocess)
 
     num_loaded = downloaded_dataset.get_numloaded()
@@ -40,7 +42,7 @@ def get_downloads_iterator(collection: str, downloaded_pages_dir: str, num_docs_
     if num_loaded < num_docs_limit:
         print(f"Limit of {num_docs_limit} documents reached. Returning {num_loaded} documents.")
         is_lim_reached = True
-    return docs_iterator, num_loaded, is_lim_reached, downloaded_dataset.docno2docid
+    return docs_iterator, num_loaded, is_lim_reached, downloaded_dataset.docno2docid, downloaded_dataset.docno2docids
     
 
 class Indexer(Component):
@@ -69,6 +71,7 @@ class Indexer(Component):
         self.batch_size = batch_size
         self.num_threads = num_threads
         self.mode = "downloads"
+        self.scorers = {} # retrieval pipelines, cached by (scorer, k, num_threads)
 
         if not os.path.exists(self.index_dir):
             os.makedirs(self.index_dir)
@@ -86,7 +89,7 @@ class Indexer(Component):
             initialise the iterator for the documents to be indexed
         """
         if downloaded_pages_dir is not None:
-            self.docs_iterator, self.num_loaded, self.flag_limit_reached, self.docno2docid = get_downloads_iterator(collection, downloaded_pages_dir, self.num_docs_limit, preprocess=preprocess)
+            self.docs_iterator, self.num_loaded, self.flag_limit_reached, self.docno2docid, self.docno2docid_dict = get_downloads_iterator(collection, downloaded_pages_dir, self.num_docs_limit, preprocess=preprocess, num_threads=self.num_threads)
         else:
             raise ValueError("downloaded_pages_dir must be provided.")
         return 
@@ -100,6 +103,8 @@ class Indexer(Component):
     def index(self) -> None:
         """
             index with a PisaIndex the documents accessible via the iterator, skipping the indexing if the index already exists.
+            PISA indexes cannot be extended once built, and BM25 statistics must cover all the indexed documents,
+            so each period of index.py builds a new index over the whole prefix of downloaded documents.
         """
         self.log("Starting indexing.", 1)
         if not os.listdir(self.index_dir):
@@ -113,10 +118,9 @@ class Indexer(Component):
             remove the index from the directory
         """
         self.log("Removing index.", 1)
-        if os.path.exists(self.index_dir):
-            for filename in os.listdir(self.index_dir):
-                file_path = os.path.join(self.index_dir, filename)
-                os.remove(file_path)
+        if os.path.isdir(self.index_dir):
+            shutil.rmtree(self.index_dir)
+            os.makedirs(self.index_dir)
         self.log(f"Index removed from directory={self.index_dir}.", 1)
 
 
@@ -125,8 +129,12 @@ class Indexer(Component):
             search the top k documents for the given queries using the specified scorer
         """
 
-        if scorer == "bm25":
+        key = (scorer, k, self.num_threads)
+        if key in self.scorers: # reuse the scorer built for a previous benchmark
+            self.scorer = self.scorers[key]
+        elif scorer == "bm25":
             self.scorer = self.inverted_index.bm25(num_results=k, threads=self.num_threads)
+            self.scorers[key] = self.scorer
             self.log("Done creating bm25 scorer.", 2)
         else:
             raise ValueError(f"Invalid scorer={scorer}. Please use 'bm25'.")
@@ -143,7 +151,10 @@ class Indexer(Component):
             transform pyterrier results into trec format and save them to csv
         """
         trec_results = self.pyterrier_to_trec(results, self.experiment_name)
-        results['docno'] = results['docno'].apply(lambda x: self.docno2docid(x))
+        if isinstance(self.docno2docid_dict, dict):
+            results['docno'] = results['docno'].map(self.docno2docid_dict) # dict lookups dispatched by pandas, not per-row python calls
+        else: # memory-mapped mapping
+            results['docno'] = results['docno'].map(self.docno2docid)
         run_fpath = self.__save_trec_results(trec_results, benchmark_name)
         return run_fpath
     
@@ -151,10 +162,15 @@ class Indexer(Component):
         """
             transform pyterrier results into trec format
         """
-        trecres = results[['qid', 'docno', 'score', 'rank']]
-        trecres["run"] = run_name
-        trecres["Q0"] = "0"
-        trecres = trecres[["qid", "Q0", "docno", "rank", "score", "run"]]
+        # built in a single construction, in trec column order, without chained assignments on a slice
+        trecres = DataFrame({
+            "qid": results["qid"].to_numpy(),
+            "Q0": "0",
+            "docno": results["docno"].to_numpy(),
+            "rank": results["rank"].to_numpy(dtype="int32"),
+            "score": results["score"].to_numpy(),
+            "run": run_name,
+        }, copy=False)
         return trecres
     
     def __save_trec_results(self, results: DataFrame, benchmark_name: str) -> str:
@@ -171,7 +187,12 @@ class Indexer(Component):
         
         self.log(f"Saving results to file={fpath}.", 2)
 
-        results.to_csv(fpath, index=False, sep='\t', header=False)
+        # lines are formatted from the column lists and written in large chunks, bypassing the pandas csv writer
+        columns = [results[col].tolist() for col in results.columns]
+        with open(fpath, 'w', buffering=1<<20) as f:
+            for start in range(0, len(results), WRITE_CHUNK_SIZE):
+                rows = zip(*(col[start:start + WRITE_CHUNK_SIZE] for col in columns))
+                f.write("".join("\t".join(map(str, row)) + "\n" for row in rows))
 
         self.log(f"Results saved in file={fpath}.", 1)
         return fpath
\ No newline at end of file
@@ -1,6 +1,13 @@
 import sys, os
-import zlib, pickle
-from datetime import datetime
+import gzip, pickle
+try:
+    import zstandard # faster compression and decompression of the url2docids file, used if available
+except ImportError:
+    zstandard = None
+import time, atexit
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
 
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
@@ -12,6 +19,9 @@ STARTING_INLINK_DIR = "./../cw22/inlink/en/en00/"
 STARTING_OUTLINK_DIR = "./../cw22/outlink/en/en00/"
 STARTING_TXT_DIR = "./../cw22/txt/en/en00/"
 LOG_FILE_PATH = "./log_url2docids.txt"
+LOG_BUFFER_SIZE = 1 << 16 # 64 KiB buffer for the log file
+ZSTD_LEVEL = 3 # zstd level used for the url2docids file, faster than gzip level 1 at a better ratio
+LOG_FILES = {} # open log files, keyed by (pid, path) so that worker processes never write through a handle inherited from the parent
 
 
 def log(message: str, log_fpath: str = LOG_FILE_PATH) -> None:
@@ -22,9 +32,23 @@ def log(message: str, log_fpath: str = LOG_FILE_PATH) -> None:
             message: message to be logged.
             log_fpath: path to the log file.
     """
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open(log_fpath, 'a') as file:
-        file.write(f"[{timestamp}] {message}\n")
+    get_log_file(log_fpath).write(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {message}\n")
+
+
+def get_log_file(log_fpath: str = LOG_FILE_PATH):
+    """
+        Return the buffered log file of the current process, opening it in append mode on first use.
+        Log files are closed (and flushed) at exit.
+
+        Args:
+            log_fpath: path to the log file.
+    """
+    key = (os.getpid(), log_fpath)
+    log_file = LOG_FILES.get(key)
+    if log_file is None:
+        log_file = LOG_FILES[key] = open(log_fpath, 'a', buffering=LOG_BUFFER_SIZE)
+        atexit.register(log_file.close)
+    return log_file
 
 
 def clear_log(log_fpath: str = LOG_FILE_PATH) -> None:
@@ -34,81 +58,82 @@ def clear_log(log_fpath: str = LOG_FILE_PATH) -> None:
         Args:
             log_fpath: path to the log file.
     """
+    log_file = LOG_FILES.pop((os.getpid(), log_fpath), None)
+    if log_file is not None:
+        log_file.close()
     with open(log_fpath, 'w') as file:
         file.write("")
 
 
-def process_links_dir(subdir_path: str, from_txt: bool) -> list:
+def list_links_files(start_dir: str) -> list:
     """
-        Process a directory containing .json.gz files and return a list of parsed objects.
+        List the .json.gz files in the subdirectories of the given directory, as a flat list of paths.
 
         Args:
-            subdir_path: str, path to the directory containing the .json.gz files.
-            from_txt: bool, whether the links are from the txt files or not.
+            start_dir: str, path to the directory containing the subdirectories of .json.gz files.
     """
-    list_dir = []
-    for filename in os.listdir(subdir_path):
-        if filename.endswith('.json.gz'):
-            file_path = os.path.join(subdir_path, filename)
-            list_dir.append(process_links_file(file_path, from_txt))
-    log(f"Processed dir: {subdir_path}.")
-    return list_dir
+    # scandir gets the entry types from readdir, so no stat call is needed per entry
+    with os.scandir(start_dir) as entries:
+        subdir_paths = [entry.path for entry in entries if entry.is_dir()]
+
+    file_paths = []
+    for subdir_path in subdir_paths:
+        with os.scandir(subdir_path) as entries:
+            file_paths.extend(entry.path for entry in entries if entry.name.endswith('.json.gz'))
+    return file_paths
 
 
-def process_links_file(file_path: str, from_txt: bool) -> dict:
+def process_links_file(file_path: str, from_txt: bool) -> Iterator[tuple]:
     """
-        Process a single .json.gz file and return its parsed links
+        Process a single .json.gz file and yield the (url, docid) pairs of its documents
 
         Args:
             file_path: str, path to the .json.gz file.
             from_txt: bool, whether the links are from the txt files or not.
     """
-    local_url2docid = {}
     url_key = "URL" if from_txt else "url"
     for doc in read_json_gz(file_path):     
-        local_url2docid[doc[url_key]] = doc["ClueWeb22-ID"]
+        yield doc[url_key], doc["ClueWeb22-ID"]
     log(f"Processed file: {file_path}.")
-    return local_url2docid
+
+
+def process_links_file_pairs(file_path: str, from_txt: bool) -> list:
+    """
+        Process a single .json.gz file and return the list of (url, docid) pairs of its documents, so that it can be sent back by a worker process.
+
+        Args:
+            file_path: str, path to the .json.gz file.
+            from_txt: bool, whether the links are from the txt files or not.
+    """
+    pairs = list(process_links_file(file_path, from_txt))
+    # worker processes exit without running atexit handlers, so flush their log after each file
+    get_log_file().flush()
+    return pairs
     
 
 def build_url2docid_mapping(start_dir: str, from_txt: bool) -> dict:
     """
-        Read the URLs from the .json.gz files in the given directory and build a url2docid mapping.
+        Read the URLs from the .json.gz files in the subdirectories of the given directory and build a url2docid mapping.
+        The files of all the subdirectories are decompressed and parsed by a single pool of processes, so there is no barrier at the end of each subdirectory.
+        The (url, docid) pairs are inserted directly into the mapping, without building a dict per file.
+        The dict is not presized: Python offers no way to do it (clear() releases the table), and resizes reuse the cached hashes of the URLs.
 
         Args:
-            start_dir: str, path to the directory containing the .json.gz files.
+            start_dir: str, path to the directory containing the subdirectories of .json.gz files.
             from_txt: bool, whether the links are from the txt files or not.
     """
     url2docids_dict = {}
-    completed_tasks = 0
-    
-    for dirname in os.listdir(start_dir):
-        subdir_path = os.path.join(start_dir, dirname)
-        if not os.path.isdir(subdir_path):
-            continue
+    file_paths = list_links_files(start_dir)
+    log(f"Processing {len(file_paths)} files from {start_dir}.")
 
-        log(f"Processing {subdir_path}.")
-        
-        local_dicts = process_links_dir(subdir_path, from_txt)
-        counter = 0
-        for local_url2docid in local_dicts:
-            url2docids_dict.update(local_url2docid)
-            counter += 1
-            log(f"Merged {counter} dicts")
-
-        completed_tasks += 1
-        log(f"Completed {completed_tasks} tasks.")
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        for pairs in executor.map(process_links_file_pairs, file_paths, repeat(from_txt), chunksize=16):
+            url2docids_dict.update(pairs)
+
+    log(f"Completed {len(file_paths)} files.")
     return url2docids_dict
 
-def clean_url(url: str) -> str:
-    """
-        Clean the URL and return a new URL.
-        
-        Args:
-            url: the URL to be cleaned.
-    """
-    new_url = url.replace("\n", "")
-    return new_url
+NEWLINE_DROP = str.maketrans('', '', '\n') # translation table removing newlines from URLs
 
 def clean_url2docids(url2docids: dict) -> dict:
     """
@@ -117,20 +142,29 @@ def clean_url2docids(url2docids: dict) -> dict:
         Args:
             url2docids: dict, a dictionary containing the URL to docid mapping.
         """
-    new_url2docids = {}
-    for url, docid in url2docids.items():
-        new_url = clean_url(url)
-        new_url2docids[new_url] = docid
-    return new_url2docids
+    return {url.translate(NEWLINE_DROP): docid for url, docid in url2docids.items()}
 
 
 def save_url2docids(url2docids: dict, fpath: str) -> None:
-    # compress data and write to file
-    compressed_data = zlib.compress(pickle.dumps(url2docids))
-    log("Done compressing url2docids.")
+    """
+        Pickle the url2docids mapping straight into a zstd (if available) or gzip stream, without building the pickled and compressed blobs in memory.
+        The mapping is stored as two parallel lists of URLs and docids, in the iteration order of the mapping.
+        The order is kept (rather than sorting by URL) because docnos are positions in that order, and every docno-keyed artifact
+        (downloads, url2ids index, quality scores and outlinks arrays) depends on them.
 
-    with open(fpath, 'wb') as f:  # save the compressed data to a file
-        f.write(compressed_data)
+        Args:
+            url2docids: dict, a dictionary containing the URL to docid mapping.
+            fpath: path to the output file.
+    """
+    urls = list(url2docids)
+    docids = list(url2docids.values())
+    with open(fpath, 'wb', buffering=1<<20) as f:
+        if zstandard is not None:
+            with zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(f, closefd=False) as zst:
+                pickle.dump((urls, docids), zst, protocol=pickle.HIGHEST_PROTOCOL)
+        else:
+            with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=1) as gz:
+                pickle.dump((urls, docids), gz, protocol=pickle.HIGHEST_PROTOCOL)
 
     log(f"Done saving compressed data to file={fpath}.")
 
@@ -169,7 +203,7 @@ def main():
     # clean urls and update the url2docids dict
     url2docids = clean_url2docids(url2docids)
 
-    save_url2docids(url2docids, fname=CLEANED_URL2DOCID_FPATH)
+    save_url2docids(url2docids, CLEANED_URL2DOCID_FPATH)
     
     if os.path.exists(RAW_URL2DOCID_FPATH):
         os.remove(RAW_URL2DOCID_FPATH)
@@ -1,4 +1,5 @@
 import sys, os
+import csv
 import argparse
 import pandas as pd
 
@@ -12,8 +13,22 @@ from typing import Iterator
 from utils.preprocecssor import Preprocessor
 from utils.config import config
 
+WRITE_BUFFER_SIZE = 1 << 20 # 1 MiB output buffer for the TSV writers
 
 
+def read_tsv(file_path: str, names: list, usecols: list = None) -> pd.DataFrame:
+    """
+        Read a headerless TSV file as strings with the C parser of pandas.
+        Quotes are not interpreted and empty fields are kept as empty strings, as when splitting each line on tabs.
+
+        Args:
+            file_path: str, the path to the TSV file.
+            names: list, the names of the columns of the file.
+            usecols: list, the columns to load (all of them if None).
+    """
+    return pd.read_csv(file_path, sep='\t', header=None, names=names, usecols=usecols, dtype=str, engine='c',
+                       quoting=csv.QUOTE_NONE, keep_default_na=False, memory_map=True)
+
 def yield_raw_queries(file_path: str) -> Iterator:
     """
         Load the raw queries from a file.
@@ -21,10 +36,8 @@ def yield_raw_queries(file_path: str) -> Iterator:
         Args:
             file_path: str, the path to the file containing the queries.
     """
-    with open(file_path, 'r') as f:
-        for line in f:
-            qid, qtext, languages = line.strip().split('\t')
-            yield qid, qtext
+    queries_df = read_tsv(file_path, names=['qid', 'qtext', 'languages'], usecols=['qid', 'qtext'])
+    yield from queries_df.itertuples(index=False, name=None)
 
 def yield_raw_qrels(file_path: str) -> Iterator:
     """
@@ -33,10 +46,8 @@ def yield_raw_qrels(file_path: str) -> Iterator:
         Args:
             file_path: str, the path to the file containing the qrels.
     """
-    with open(file_path, 'r') as f:
-        for line in f:
-            qid, docid = line.strip().split('\t')
-            yield qid, docid
+    qrels_df = read_tsv(file_path, names=['qid', 'docid'])
+    yield from qrels_df.itertuples(index=False, name=None)
 
 def write_msmarco_queries_to_file(queries: dict, file_path: str) -> None:
     """
@@ -46,9 +57,8 @@ def write_msmarco_queries_to_file(queries: dict, file_path: str) -> None:
             queries: dict, a dictionary containing the preprocessed queries.
             file_path: str, the path to the file where the preprocessed queries will be written.
     """
-    with open(file_path, 'w') as f:
-        for qid, qtext in queries.items():
-            f.write(f"{qid}\t{qtext}\n")
+    with open(file_path, 'w', buffering=WRITE_BUFFER_SIZE) as f:
+        f.writelines(f"{qid}\t{qtext}\n" for qid, qtext in queries.items())
 
     print(f"Written {len(queries)} preprocessed queries to:", file_path)
 
@@ -60,9 +70,8 @@ def write_msmarco_qrels_to_file(qrels: dict, file_path: str) -> None:
             qrels: dict, a dictionary containing the preprocessed qrels.
             file_path: str, the path to the file where the preprocessed qrels will be written.
     """
-    with open(file_path, 'w') as f:
-        for qid, docid in qrels.items():
-            f.write(f"{qid}\t{docid}\n")
+    with open(file_path, 'w', buffering=WRITE_BUFFER_SIZE) as f:
+        f.writelines(f"{qid}\t{docid}\n" for qid, docid in qrels.items())
 
     print(f"Written {len(qrels)} preprocessed qrels to:", file_path)
 
@@ -95,19 +104,17 @@ def save_rq_qrels_to_file(qrels_df: pd.DataFrame, output_fpath: str, url2docids_
     
     print("Number of qrels before filtering: ", len(qrels_df))
     url2docids = load_url2docids(url2docids_fpath)
-    qrels_df['docid'] = qrels_df['url'].apply(lambda x: url2docids.get(x, None))
+    qrels_df['docid'] = qrels_df['url'].map(url2docids)
     qrels_df = qrels_df.dropna(subset=['docid'])
     qrels_df.drop(columns=['question', 'url'], inplace=True)
     qrels_df = qrels_df.rename(columns={'id': 'qid', 'docid': 'docno', 'click': 'rel'})
     qrels_df = qrels_df.reindex(columns=['qid', 'docno', 'rel'])
-    print("Number of qrels after filtering: ", len(df))
-    qrels_df = qrels_df.loc[qrels_df.groupby('qid')['rel'].idxmax()]
+    print("Number of qrels after filtering: ", len(qrels_df))
+    # keep the first most clicked document of each query, ordered by qid (a stable sort plus hash-based dedup instead of groupby-idxmax)
+    qrels_df = qrels_df.sort_values(['qid', 'rel'], ascending=[True, False], kind='stable').drop_duplicates(subset='qid', keep='first')
     qrels_df['rel'] = 1
     print("Number of qrels after filtering for max: ", len(qrels_df))
-   
-    queries_df = qrels_df.groupby('qid').agg(question=('qid', 'first')).reset_index()
-    print("Number of queries after filtering:", len(queries_df))   
-    del queries_df 
+    print("Number of queries after filtering:", len(qrels_df))
 
     qrels_df.to_csv(output_fpath, sep='\t', index=False, header=False)
     print("Saved qrels to file=", output_fpath)
@@ -125,10 +132,19 @@ def clean_rq_data(dataset_df: pd.DataFrame) -> pd.DataFrame:
     """
     df_exploded = dataset_df.explode('DocStream', ignore_index=True)
 
-    df_exploded['url'] = df_exploded['DocStream'].apply(lambda x: x.get('Url'))
-    df_exploded['click'] = df_exploded['DocStream'].apply(lambda x: x.get('Click_Cnt'))
-    df_exploded['language'] = df_exploded['DocStream'].apply(lambda x: x.get('UrlLanguage'))
-    df_exploded = df_exploded[df_exploded['language'] == 'en']
+    if isinstance(df_exploded['DocStream'].dtype, pd.ArrowDtype):
+        # project the fields of the Arrow struct column, without touching Python objects
+        doc_stream = df_exploded['DocStream'].struct
+        df_exploded['url'] = doc_stream.field('Url')
+        df_exploded['click'] = doc_stream.field('Click_Cnt')
+        df_exploded['language'] = doc_stream.field('UrlLanguage')
+    else:
+        # expand the DocStream dicts into columns with a single traversal of the object column
+        doc_stream = pd.DataFrame(df_exploded['DocStream'].tolist(), index=df_exploded.index)
+        df_exploded['url'] = doc_stream['Url']
+        df_exploded['click'] = doc_stream['Click_Cnt']
+        df_exploded['language'] = doc_stream['UrlLanguage']
+    df_exploded = df_exploded[df_exploded['language'].eq('en').fillna(False).to_numpy(dtype=bool)]
 
     df_exploded.drop(columns=['DocStream', 'intrinsic_scores', 'gpt4_decomposition', 'decompositional_score', 'nonfactoid_score', 'language'], inplace=True)
 
@@ -139,11 +155,12 @@ def clean_rq_data(dataset_df: pd.DataFrame) -> pd.DataFrame:
 def load_rq_data(split: str = "test") -> pd.DataFrame:
     """
         Load a split of the Researchy Questions dataset.
+        The underlying Arrow table is converted to Arrow-backed columns, instead of building the DataFrame from one Python dict per row.
 
         Args: split: the split to load (train, validation, test)
     """
     dataset = load_dataset('corbyrosset/researchy_questions', split=split)
-    dataset_df = pd.DataFrame(dataset)
+    dataset_df = dataset.with_format('arrow')[:].to_pandas(types_mapper=pd.ArrowDtype)
     return dataset_df
 
 
@@ -188,26 +205,11 @@ def main():
         CLEANED_QUERIES_FPATH = f"{QUERIES_DIR}{benchmark_str}/{BENCHMARKS[benchmark_str]['queries_file']}"
         CLEANED_QRELS_FPATH = f"{QRELS_DIR}{benchmark_str}/{BENCHMARKS[benchmark_str]['qrels_file']}"
 
-        preprocessed_queries = {}
-        discarded = 0
-        for qid, qtext in yield_raw_queries(QUERIES_FPATH):
-            cleaned_text = Preprocessor.process_document(qtext)
-            if cleaned_text is not None:
-                preprocessed_queries[qid] = cleaned_text
-            else:
-                discarded += 1
-
-        cleaned_qrels = {}
-        for qid, docid in yield_raw_qrels(QRELS_FPATH):
-            if qid in preprocessed_queries:
-                cleaned_qrels[qid] = docid
-
-        preprocessed_qids = set(preprocessed_queries.keys())
-
-        for qid in preprocessed_qids:
-            if qid not in cleaned_qrels:
-                preprocessed_queries.pop(qid)
-                discarded += 1
+        # preprocess the queries, keep the qrels of the surviving queries, then the queries with qrels, in their original order
+        raw_queries = {qid: Preprocessor.process_document(qtext) for qid, qtext in yield_raw_queries(QUERIES_FPATH)}
+        cleaned_qrels = {qid: docid for qid, docid in yield_raw_qrels(QRELS_FPATH) if raw_queries.get(qid) is not None}
+        preprocessed_queries = {qid: qtext for qid, qtext in raw_queries.items() if qid in cleaned_qrels}
+        discarded = len(raw_queries) - len(preprocessed_queries)
 
         print(f"Discarded {discarded} queries.")
         print(f"Total number of queries after preprocessing: {len(preprocessed_queries)}")
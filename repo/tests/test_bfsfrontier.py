@@ -10,26 +10,26 @@ def frontier_manager():
 
 def test_add_page(frontier_manager):
     """Test adding a page to the frontier."""
-    page = WebPage(id=1, url="http://example.com")
+    page = WebPage(id=1, url="http://example.com", docno=0)
     frontier_manager.add(page)
     
-    # Check that the URL was added to the queue
+    # Check that the docno was added to the queue
     assert frontier_manager.enqueued() == 1
 
-    popped_url = frontier_manager.pop()
-    assert popped_url == "http://example.com"
+    popped_docno = frontier_manager.pop()
+    assert popped_docno == 0
     assert frontier_manager.enqueued() == 0
 
 
 def test_add_page_with_max_priority(frontier_manager):
     """Test adding a page to the frontier with max priority."""
-    page = WebPage(id=1, url="http://example.com")
-    frontier_manager.add_with_max_priority(page)
+    page = WebPage(id=1, url="http://example.com", docno=0)
+    frontier_manager.add_with_max_priority(page.get_url(), page.get_docno())
     
-    # Check that the URL was added to the queue
+    # Check that the docno was added to the queue
     assert frontier_manager.enqueued() == 1
-    popped_url = frontier_manager.pop()
-    assert popped_url == "http://example.com"
+    popped_docno = frontier_manager.pop()
+    assert popped_docno == 0
     assert frontier_manager.enqueued() == 0
 
 def test_pop_from_empty_queue(frontier_manager):
@@ -39,30 +39,30 @@ def test_pop_from_empty_queue(frontier_manager):
 
 def test_enqueued(frontier_manager):
     """Test the enqueued method."""
-    page1 = WebPage(id=1, url="http://example.com")
+    page1 = WebPage(id=1, url="http://example.com", docno=0)
     assert frontier_manager.enqueued() == 0
     
     frontier_manager.add(page1)
     assert frontier_manager.enqueued() == 1
 
-    page2 = WebPage(id=9, url="http://example2.com")
+    page2 = WebPage(id=9, url="http://example2.com", docno=8)
 
     frontier_manager.add(page2)
     assert frontier_manager.enqueued() == 2
 
 
-    page3 = WebPage(id=17, url="http://example3.com")
+    page3 = WebPage(id=17, url="http://example3.com", docno=16)
     frontier_manager.add(page3)
     assert frontier_manager.enqueued() == 3
 
-    popped_url = frontier_manager.pop()
+    popped_docno = frontier_manager.pop()
     assert frontier_manager.enqueued() == 2
-    assert popped_url == "http://example.com"
+    assert popped_docno == 0
 
-    popped_url = frontier_manager.pop()
+    popped_docno = frontier_manager.pop()
     assert frontier_manager.enqueued() == 1
-    assert popped_url == "http://example2.com"
+    assert popped_docno == 8
 
-    popped_url = frontier_manager.pop()
+    popped_docno = frontier_manager.pop()
     assert frontier_manager.enqueued() == 0
-    assert popped_url == "http://example3.com"
\ No newline at end of file
+    assert popped_docno == 16
\ No newline at end of file
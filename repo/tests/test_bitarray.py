@@ -7,7 +7,7 @@ from crawler.seen import BitArraySeenURLTester
 
 @pytest.fixture
 def tester():
-    return BitArraySeenURLTester(verbose=False, capacity=10)
+    return BitArraySeenURLTester(capacity=10)
 
 def test_initial_seen_count(tester):
     assert tester.seen_count() == 0, "Initial seen count should be 0."
@@ -39,4 +39,20 @@ def test_capacity_limit(tester):
 
 def test_over_capacity(tester):
     with pytest.raises(IndexError):
-        tester.mark_seen(11)
\ No newline at end of file
+        tester.mark_seen(11)
+
+def test_negative_docid(tester):
+    with pytest.raises(IndexError):
+        tester.mark_seen(-1)
+
+def test_mark_seen_batch_count(tester):
+    tester.mark_seen(4)
+    tester.mark_seen_batch([1, 4, 6, 6])
+    assert tester.is_seen_batch([1, 4, 5, 6]) == [True, True, False, True], "URLs with docid 1, 4 and 6 should be marked as seen."
+    assert tester.seen_count() == 3, "Seen count should only count newly marked URLs in a batch."
+
+def test_is_seen_and_mark(tester):
+    assert not tester.is_seen_and_mark(8), "URL with docid 8 should not be seen before marking it."
+    assert tester.is_seen(8), "URL with docid 8 should be marked as seen."
+    assert tester.is_seen_and_mark(8), "URL with docid 8 should be seen after marking it."
+    assert tester.seen_count() == 1, "Seen count should be 1 after marking the same URL twice."
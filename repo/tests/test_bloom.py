@@ -0,0 +1,35 @@
+import pytest
+
+import sys, os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from crawler.seen import BloomSeenURLTester
+
+@pytest.fixture
+def tester():
+    return BloomSeenURLTester(capacity=1000, fpr=1e-4)
+
+def test_initial_seen_count(tester):
+    assert tester.seen_count() == 0, "Initial seen count should be 0."
+
+def test_mark_and_check_seen(tester):
+    tester.mark_seen(3)
+    assert tester.is_seen(3), "URL with docid 3 should be marked as seen."
+    assert tester.seen_count() == 1, "Seen count should be 1 after marking one URL."
+
+def test_mark_seen_multiple_times(tester):
+    tester.mark_seen(2)
+    tester.mark_seen(2)  # Marking again
+    assert tester.is_seen(2), "URL with docid 2 should be marked as seen."
+    assert tester.seen_count() == 1, "Seen count should be 1 after marking the same URL twice."
+
+def test_no_false_negatives(tester):
+    for docid in range(0, 2000, 2):
+        tester.mark_seen(docid)
+    assert all(tester.is_seen(docid) for docid in range(0, 2000, 2)), "Marked URLs should always be seen."
+
+def test_false_positive_rate(tester):
+    for docid in range(1000):
+        tester.mark_seen(docid)
+    false_positives = sum(tester.is_seen(docid) for docid in range(1000, 101000))
+    assert false_positives / 100000 < 1e-3, "False positive rate should be close to the target."
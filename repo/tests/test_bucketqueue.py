@@ -0,0 +1,100 @@
+import pytest
+
+import sys, os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from utils.priorityqueue import PQueueBucket
+from crawler.frontier import QualityFrontierManager
+
+@pytest.fixture
+def pq():
+    """Fixture to create a new PQueueBucket instance for each test."""
+    return PQueueBucket(min_priority=-50, max_priority=1)
+
+def test_put_get(pq):
+    """Test get."""
+    pq.put("https://example.com/page1", -10)
+    pq.put("https://example.com/page2", -40)
+    pq.put("https://example.com/page3", 1)
+
+    item, priority = pq.get()
+    assert item == "https://example.com/page3"
+    assert priority == 1
+    item, _ = pq.get()
+    assert item == "https://example.com/page1"
+    item, _ = pq.get()
+    assert item == "https://example.com/page2"
+
+    with pytest.raises(KeyError):
+        pq.get()
+
+def test_same_bucket_fifo(pq):
+    """Test that items in the same bucket are popped in insertion order."""
+    pq.put("item1", 0.5)
+    pq.put("item2", 0.51)
+    pq.put("item3", 0.49)
+
+    assert [pq.get()[0] for _ in range(3)] == ["item1", "item2", "item3"]
+
+def test_out_of_range_priorities(pq):
+    """Test that priorities outside the range are clipped to the extreme buckets."""
+    pq.put("low", -100)
+    pq.put("high", 10)
+
+    assert pq.get()[0] == "high"
+    assert pq.get()[0] == "low"
+
+def test_update_priority(pq):
+    """Test update."""
+    pq.put("https://example.com/page1", -30)
+    pq.put("https://example.com/page2", -40)
+    pq.put("https://example.com/page3", -10)
+
+    assert pq.update("https://example.com/page1", 0)
+    assert pq.update("https://example.com/page2", -45) # skipped, lower priority
+    assert not pq.update("https://example.com/page4", 0) # not enqueued
+    assert pq.enqueued() == 3
+
+    assert [pq.get()[0] for _ in range(3)] == ["https://example.com/page1", "https://example.com/page3", "https://example.com/page2"]
+    assert pq.enqueued() == 0
+    with pytest.raises(KeyError):
+        pq.get() # stale entries are not returned
+
+def test_remove(pq):
+    """Test remove."""
+    pq.put("https://example.com/page1", -30)
+    pq.put("https://example.com/page2", -10)
+    pq.update("https://example.com/page1", 0)
+
+    pq.remove("https://example.com/page1")
+    pq.remove("https://example.com/page3") # not enqueued
+    assert pq.enqueued() == 1
+
+    assert pq.get()[0] == "https://example.com/page2"
+    with pytest.raises(KeyError):
+        pq.get() # entries of the removed item are not returned
+
+def test_get_all_items(pq):
+    """Test get_all_items."""
+    pq.put("https://example.com/page1", -30)
+    pq.put("https://example.com/page2", -40)
+    pq.put("https://example.com/page3", -10)
+    pq.put("https://example.com/page4", -10)
+    pq.update("https://example.com/page2", 0)
+    pq.remove("https://example.com/page4")
+
+    items = pq.get_all_items()
+    assert items == ["https://example.com/page2", "https://example.com/page3", "https://example.com/page1"]
+    assert pq.enqueued() == 3 # items are not removed
+    assert [pq.get()[0] for _ in range(3)] == items
+
+def test_quality_frontier_remove_and_get_all_docnos():
+    """Test the bucket queue through the quality frontier manager."""
+    frontier_manager = QualityFrontierManager(updates=True, verbose=False, oracle=True, bucket_queue=True)
+    frontier_manager.add_with_max_priority("http://example.com/1", 1)
+    frontier_manager.add_with_max_priority("http://example.com/2", 2)
+
+    frontier_manager.remove(1)
+    assert frontier_manager.get_all_docnos() == [2]
+    with pytest.raises(ValueError):
+        frontier_manager.remove(1) # already removed
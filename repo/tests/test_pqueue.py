@@ -3,12 +3,12 @@ import pytest
 import sys, os
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from utils.priorityqueue import PQueue
+from utils.priorityqueue import PQueuePriorityQueue, PQueueHeap
 
 @pytest.fixture
 def pq():
-    """Fixture to create a new PQueue instance for each test."""
-    return PQueue()
+    """Fixture to create a new PQueuePriorityQueue instance for each test."""
+    return PQueuePriorityQueue()
 
 def test_put_get(pq):
     """Test get."""
@@ -87,6 +87,7 @@ def test_enqueued_count(pq):
 
     pq.get()
     assert pq.enqueued() == 0
+    pq._check_invariants()
 
 def test_cleanup_deleted(pq):
     pq.put("item1", 5)
@@ -142,7 +143,7 @@ def test_many_cleanup_deleted(pq):
     pq.put("item5", 4)
     assert pq.enqueued() == 5
     
-    assert pq.enqueued() == (pq.queue.qsize() - pq.num_deleted)
+    assert pq.enqueued() == (len(pq.queue) - pq.num_deleted)
     pq.update("item1", 3)
     pq.update("item2", 3)
     assert pq.num_deleted == 0
@@ -157,7 +158,7 @@ def test_many_cleanup_deleted(pq):
     assert item == "item3"  # the first item should be the first
 
     assert pq.enqueued() == 4  # number of enqueued items
-    assert pq.enqueued() == (pq.queue.qsize() - pq.num_deleted)  # number of enqueued items should be the same as the queue size
+    assert pq.enqueued() == (len(pq.queue) - pq.num_deleted)  # number of enqueued items should be the same as the queue size
 
 def test_many_cleanup_deleted2(pq):
     pq.put("item1", 5)
@@ -167,7 +168,7 @@ def test_many_cleanup_deleted2(pq):
     pq.put("item5", 4)
     assert pq.enqueued() == 5
     
-    assert pq.enqueued() == (pq.queue.qsize() - pq.num_deleted)
+    assert pq.enqueued() == (len(pq.queue) - pq.num_deleted)
     pq.update("item1", 3) # skipped
     pq.update("item1", 12)
     pq.update("item1", 11) # skipped
@@ -187,4 +188,25 @@ def test_many_cleanup_deleted2(pq):
     assert item == "item3"  # the first item should be the first
 
     assert pq.enqueued() == 3  # number of enqueued items
-    assert pq.enqueued() == (pq.queue.qsize() - pq.num_deleted)  # number of enqueued items should be the same as the queue size
\ No newline at end of file
+    assert pq.enqueued() == (len(pq.queue) - pq.num_deleted)  # number of enqueued items should be the same as the queue size
+    pq._check_invariants()
+
+def test_heap_update():
+    """Test update of PQueueHeap, which starts tracking the positions of the items."""
+    pq = PQueueHeap()
+    pq.put("item1", 5)
+    pq.put("item2", 3)
+    pq.put("item3", 8)
+    pq.put_batch(["item4", "item5"], [2, 4])
+
+    pq.update("item4", 9)
+    pq.update("item1", 1) # skipped
+    pq.update("item6", 20) # not enqueued
+    pq.put("item6", 6)
+
+    items = [pq.get()[0] for _ in range(pq.enqueued())]
+    assert items == ["item4", "item3", "item6", "item1", "item5", "item2"]
+    assert pq.index == {}
+
+    with pytest.raises(KeyError):
+        pq.get()
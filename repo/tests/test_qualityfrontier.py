@@ -0,0 +1,46 @@
+import pytest
+
+from crawler.frontier import QualityFrontierManager
+from crawler.webpage import WebPage
+
+def make_page(docno, qscore):
+    page = WebPage(url=f"http://example.com/{docno}", docno=docno)
+    page.set_metadata({"qscore": qscore})
+    return page
+
+@pytest.fixture
+def frontier_manager():
+    return QualityFrontierManager(updates=True, verbose=False, oracle=True)
+
+
+def test_submit_batch_tie_order(frontier_manager):
+    """Test that updates and additions with equal priority keep the order of the batch."""
+    father = make_page(0, 1.0)
+    frontier_manager.add_batch([make_page(1, 0.2), make_page(2, 0.1)], father)
+
+    frontier_manager.submit_batch([make_page(3, 0.5), make_page(1, 0.5), make_page(4, 0.5), make_page(2, 0.5)], [False, True, False, True], father)
+
+    popped = [frontier_manager.pop() for _ in range(frontier_manager.enqueued())]
+    assert popped == [3, 1, 4, 2]
+
+
+def test_submit_batch_same_as_one_by_one(frontier_manager):
+    """Test that submitting a batch is equivalent to adding and updating the pages one by one, in order."""
+    reference = QualityFrontierManager(updates=True, verbose=False, oracle=True)
+    father = make_page(0, 1.0)
+    seen = [make_page(docno, 0.1 * docno) for docno in range(1, 6)]
+    frontier_manager.add_batch(seen, father)
+    reference.add_batch(seen, father)
+
+    pages = [make_page(docno, 0.3) for docno in [6, 1, 2, 7, 8, 3, 9]]
+    seen_flags = [page.get_docno() < 6 for page in pages]
+    frontier_manager.submit_batch(pages, seen_flags, father)
+    for page, page_seen in zip(pages, seen_flags):
+        if page_seen:
+            reference.update(page, father)
+        else:
+            reference.add(page, father)
+
+    popped = [frontier_manager.pop() for _ in range(frontier_manager.enqueued())]
+    expected = [reference.pop() for _ in range(reference.enqueued())]
+    assert popped == expected
@@ -1,4 +1,4 @@
-import datetime
+import time
 
 class Component:
    
@@ -7,9 +7,15 @@ class Component:
     def __init__(self, verbose: bool, verbosity: int = 2) -> None:
         self.verbose = verbose
         self.verbosity = verbosity
+        # silent components swap log for a no-op, so their log calls skip the verbosity check (unless a subclass overrides log)
+        if not verbose and type(self).log is Component.log:
+            self.log = self._log_noop
         
         
     def log(self, msg: str, priority: int = 2) -> None:
         if self.verbose and priority <= self.verbosity:
-            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"[{self.component_name}][{current_time}]: {msg}")
\ No newline at end of file
+            current_time = time.strftime("%Y-%m-%d %H:%M:%S")
+            print(f"[{self.component_name}][{current_time}]: {msg}")
+
+    def _log_noop(self, msg: str, priority: int = 2) -> None:
+        pass
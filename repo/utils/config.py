@@ -1,16 +1,25 @@
 # config.py
 import yaml
+from functools import lru_cache
 
 CONFIG_FPATH = "./configs/config.yaml"
+CONFIG_CACHE_SIZE = 128
+
+# use the libyaml bindings when available, they are much faster than the pure-Python loader
+try:
+    YAML_LOADER = yaml.CSafeLoader
+except AttributeError:
+    YAML_LOADER = yaml.SafeLoader
 
 class Config:
     def __init__(self, config_path: str = CONFIG_FPATH):
         with open(config_path, 'r') as file:
-            self.config = yaml.safe_load(file)
+            self.config = yaml.load(file, Loader=YAML_LOADER)
 
+    @lru_cache(maxsize=CONFIG_CACHE_SIZE)
     def get(self, section, option = None, default=None):
         sec = self.config.get(section, {})  
         return sec if option is None else sec.get(option, default)
 
 # ensure config is loaded once
-config = Config()
\ No newline at end of file
+config = Config()
@@ -1,20 +1,44 @@
 import pandas as pd
-import math
-from tqdm import tqdm
+import numpy as np
+import os
+import hashlib, pickle
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
 from utils.config import config
 from indexer.dataset import MSMarcoWebSearch, ResearchyQuestions, Downloads
+from utils.datasetIR import load_downloaded_list, count_downloaded_list
 
 DOWNLOAD_PAGES_DIR = config.get('paths').get('downloaded_pages_dir')
+CACHE_DIR = config.get('paths', 'cache_dir', './../../data/cache/')
+QRELS_CACHE = config.get('evaluation', 'qrels_cache', True) # snapshot the merged qrels on disk, keyed by the qrels files
+
+_CUM_INV_LOG2 = np.zeros(1) # cumulative 1/log2(i+1) discounts, _CUM_INV_LOG2[k] is the MaxNDCG of k relevant documents
+
+def _cum_inv_log2(max_rel: int) -> np.ndarray:
+    """
+        Return the table of cumulative discounts, grown (at least doubled) to cover max_rel relevant documents.
+
+        Args:
+            max_rel: maximum number of relevant documents to cover
+    """
+    global _CUM_INV_LOG2
+    if max_rel >= _CUM_INV_LOG2.size:
+        size = max(max_rel, 2 * _CUM_INV_LOG2.size)
+        _CUM_INV_LOG2 = np.concatenate(([0.0], np.cumsum(1 / np.log2(np.arange(2, size + 2)))))
+    return _CUM_INV_LOG2
 
 def _maxndcg(num_rel: int) -> float:
     """
         Compute MaxNDCG for a given number of relevant documents.
     """
-    return sum(1 / math.log2(i + 1) for i in range(1, num_rel+1))
+    return float(_cum_inv_log2(num_rel)[num_rel])
+
+CRAWL_METRICS = ('harvest', 'recall', 'irr_ratio', 'nrel') # metrics computed from the number of downloaded relevant documents
 
 def _calc_cmetric(target_metric: str, downloaded_relevant: int, downloaded: int, relevant: int) -> float:
     """
         Compute the crawling metric based on the target metric and return it as a float value.
+        Counts can also be numpy arrays, in which case the metric is computed element-wise.
         
         Args:
             target_metric: string identifier of the target metric
@@ -32,74 +56,180 @@ def _calc_cmetric(target_metric: str, downloaded_relevant: int, downloaded: int,
         metric = downloaded_relevant
     return metric
 
-def _crawling_stats(downl_docids: list, relevant_set: set, target_metrics: list, tested_limits: list) -> dict:
+def _crawling_stats(downl_docnos: np.ndarray, relevant_bits: np.ndarray, num_relevant: int, target_metrics: list, tested_limits: list) -> dict:
     """
-        Given a list of downloaded documents and the set of groundtruth relevant documents,
+        Given the array of downloaded docnos and the flags of the groundtruth relevant docnos,
         compute the crawling metrics for each maximum limit (i.e., for the first lim downloaded documents).
     
         Args:
-            downl_docids: list of downloaded document ids
-            relevant_set: set of relevant document ids
+            downl_docnos: array of downloaded docnos
+            relevant_bits: array of uint8 flags indexed by docno, set for relevant documents
+            num_relevant: number of relevant documents (including those not in the collection)
             target_metrics: list of target metrics
             tested_limits: list of tested limits
     """
-    start_idx = 0
-    last_downloaded_rel = 0
-    all_cmetrics = []
     print("Target metrics: ", target_metrics)
     print("Tested limits: ", tested_limits)
-    print("Number of downloaded documents: ", len(downl_docids))
-    print("Relevant documents: ", len(relevant_set))
+    print("Number of downloaded documents: ", len(downl_docnos))
+    print("Relevant documents: ", num_relevant)
 
-    for limit in tqdm(tested_limits, total=len(tested_limits), desc=f"Processing limits", unit='limit'):
-        newly_downloaded_set = set(downl_docids[start_idx:limit]) # new subset of downloaded documents
+    # mark the relevant downloads with a gather of their flags, then count the relevant documents within each limit from the prefix sums
+    is_relevant = relevant_bits[downl_docnos]
+    cum_relevant = np.concatenate(([0], np.cumsum(is_relevant, dtype=np.int64)))
 
-        downloaded_relevant = len(relevant_set.intersection(newly_downloaded_set)) + last_downloaded_rel            
+    # each metric is computed for all the limits at once, as a column of a dataframe (other metrics, e.g. maxndcg, are computed by the caller)
+    limits = np.asarray(tested_limits, dtype=np.int64)
+    downloaded_relevant = cum_relevant[np.minimum(limits, len(downl_docnos))]
+    all_cmetrics = pd.DataFrame({metric_name: _calc_cmetric(target_metric=metric_name, downloaded_relevant=downloaded_relevant, downloaded=limits, relevant=num_relevant)
+                                 for metric_name in target_metrics if metric_name in CRAWL_METRICS}, index=range(len(limits)))
+    return all_cmetrics.to_dict('records')
 
-        crawl_metrics = {}
-        for metric_name in target_metrics:
-            cmetric = _calc_cmetric(target_metric=metric_name, downloaded_relevant=downloaded_relevant, downloaded=limit, relevant=len(relevant_set))
-            crawl_metrics[metric_name] = cmetric
+def _load_downloads(exp_name: str, max_limit: int, docno_dtype: np.dtype = np.int32) -> np.ndarray:
+    """
+        Load the downloaded docnos for a given experiment.
+        Docnos are not translated to docids, so the mappings of the collection are not needed.
 
-        start_idx = limit
-        last_downloaded_rel = downloaded_relevant
-        all_cmetrics.append(crawl_metrics)
-    return all_cmetrics
+        Args:
+            exp_name: string identifier of the experiment
+            max_limit: maximum limit of downloaded documents
+            docno_dtype: integer dtype of the returned docnos
+    """
+    path_to_downloaded = f"{DOWNLOAD_PAGES_DIR}/{exp_name}/"
+    downl_docnos = load_downloaded_list(path_to_downloaded, limit=max_limit)
+    return downl_docnos.astype(docno_dtype, copy=False)
 
-def _load_downloads(exp_name: str, max_limit: int, collection_name: str = "cw22b") -> list:
+def _count_downloads(exp_name: str, max_limit: int) -> int:
     """
-        Load the downloaded document ids for a given experiment and collection.
+        Count the downloaded docnos of a given experiment, up to max_limit, without loading them.
 
         Args:
             exp_name: string identifier of the experiment
             max_limit: maximum limit of downloaded documents
-            collection_name: string identifier of the collection
     """
-    path_to_downloaded = f"{DOWNLOAD_PAGES_DIR}/{exp_name}/"
-    downl_docids = Downloads(collection_name).load_downloads_docids(data_dir=path_to_downloaded, limit=max_limit)
-    return downl_docids
+    return count_downloaded_list(f"{DOWNLOAD_PAGES_DIR}/{exp_name}/", limit=max_limit)
+
+def _qrels_cache_fpath(qrels_datasets: list, with_qid: bool) -> str:
+    """
+        Return the path of the on-disk snapshot of the merged qrels.
+        The key hashes the path, size and modification time of each qrels file, so that a snapshot is never reused after the qrels change.
+
+        Args:
+            qrels_datasets: list of query set datasets
+            with_qid: whether the query ids are kept in the qrels
+    """
+    key_parts = []
+    for qrels_dataset in qrels_datasets:
+        stat = os.stat(qrels_dataset.qrels_fpath)
+        key_parts.append((os.path.abspath(qrels_dataset.qrels_fpath), stat.st_size, stat.st_mtime_ns))
+    key = hashlib.sha1(repr((key_parts, with_qid)).encode()).hexdigest()
+    return os.path.join(CACHE_DIR, f"qrels_{key}.pkl")
 
 def _load_qrels_in_df(query_sets: list, target_metrics: list) -> pd.DataFrame:
-    qrels = []
+    """
+        Load the qrels of the query sets in a single dataframe without duplicates.
+        When enabled, the dataframe is snapshotted on disk and reloaded by later calls, skipping the parsing of the qrels files.
 
+        Args:
+            query_sets: list of string identifiers of query sets
+            target_metrics: list of target metrics (query ids are only kept for maxndcg)
+    """
+    qrels_datasets = []
     for benchmark in query_sets:
         if benchmark == "msmarco-ws":
-            qrels_dataset = MSMarcoWebSearch(benchmark=benchmark)
-          
+            qrels_datasets.append(MSMarcoWebSearch(benchmark=benchmark))
         elif benchmark == "rq":
-            qrels_dataset = ResearchyQuestions(benchmark=benchmark)
+            qrels_datasets.append(ResearchyQuestions(benchmark=benchmark))
         else:
             raise ValueError(f"Unknown benchmark: {benchmark}")
-        
+
+    with_qid = "maxndcg" in target_metrics
+    if QRELS_CACHE:
+        cache_fpath = _qrels_cache_fpath(qrels_datasets, with_qid)
+        if os.path.exists(cache_fpath):
+            return pd.read_pickle(cache_fpath)
+
+    qrels = []
+    for qrels_dataset in qrels_datasets:
         qrels_df = qrels_dataset.get_qrels()
-        if "maxndcg" not in target_metrics:
+        if not with_qid:
             qrels_df.drop('query_id', axis=1, inplace=True)
         qrels.append(qrels_df)
   
     qrels_df = pd.concat(qrels)
     qrels_df.drop_duplicates(ignore_index=True, inplace=True)
+
+    if QRELS_CACHE:
+        # write to a temporary file first, so that concurrent evaluations never read a partial snapshot
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_fpath = f"{cache_fpath}.{os.getpid()}.tmp"
+        qrels_df.to_pickle(tmp_fpath, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_fpath, cache_fpath)
     return qrels_df
 
+_EVAL_STATE = {} # qrels-derived state shared by the experiments evaluated in a worker process
+
+def _init_eval_worker(state: dict, relevant_bits_shm: tuple) -> None:
+    """
+        Initialize a worker process with the qrels-derived state, so that it is pickled once per worker rather than once per experiment.
+        The relevant flags, one per document of the collection, are attached read-only from shared memory instead of being pickled.
+
+        Args:
+            state: dictionary with the target metrics and the (query, relevant docno) arrays
+            relevant_bits_shm: (name, shape) of the shared memory block holding the relevant flags
+    """
+    shm_name, shape = relevant_bits_shm
+    shm = SharedMemory(name=shm_name)
+    relevant_bits = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    relevant_bits.flags.writeable = False
+    _EVAL_STATE.update(state, relevant_bits=relevant_bits, relevant_bits_shm=shm) # keep a reference to the block, which backs the array
+
+def _evaluate_experiment(exp_name: str, tested_limits: list) -> list:
+    """
+        Compute the crawling metrics of a single experiment at each limit, using the state set by _init_eval_worker.
+        Returns the list of metrics at each limit.
+
+        Args:
+            exp_name: string identifier of the experiment
+            tested_limits: list of int limits, already clamped by evaluate_crawling_metrics
+    """
+    target_metrics = _EVAL_STATE['target_metrics']
+    crawl_metrics = []
+
+    # load the array of downloads (max limit)
+    downl_docnos = _load_downloads(exp_name=exp_name, max_limit=max(tested_limits), docno_dtype=_EVAL_STATE['docno_dtype'])
+
+    if ("harvest" in target_metrics) or ("recall" in target_metrics) or ("irr_ratio" in target_metrics) or ("nrel" in target_metrics):
+        crawl_metrics = _crawling_stats(downl_docnos=downl_docnos, relevant_bits=_EVAL_STATE['relevant_bits'], num_relevant=_EVAL_STATE['num_relevant'], target_metrics=target_metrics, tested_limits=tested_limits)
+
+    if "maxndcg" in target_metrics:
+        qid_codes, num_qids, cum_inv_log2 = _EVAL_STATE['qid_codes'], _EVAL_STATE['num_qids'], _EVAL_STATE['cum_inv_log2']
+        rel_docnos = _EVAL_STATE['rel_docnos']
+        maxndcg_at_limits = []
+        # first download position of the relevant documents of each query (inf if never downloaded), so that each limit is a single comparison
+        downloaded, first_position = np.unique(downl_docnos, return_index=True)
+        rel_positions = np.full(len(rel_docnos), np.inf)
+        if len(downloaded) > 0:
+            pos = np.minimum(np.searchsorted(downloaded, rel_docnos), len(downloaded) - 1)
+            found = downloaded[pos] == rel_docnos
+            rel_positions[found] = first_position[pos[found]]
+
+        for limit in tested_limits:
+            downloaded_relevant = np.bincount(qid_codes[rel_positions < limit], minlength=num_qids)
+            all_maxndcg = cum_inv_log2[downloaded_relevant]
+            
+            if _EVAL_STATE['aggregate']:
+                maxndcg_at_limits.append(float(all_maxndcg.mean()))
+            else:
+                maxndcg_at_limits.append(all_maxndcg.tolist())
+        
+        if len(crawl_metrics) == 0:
+            crawl_metrics = [{"maxndcg": val} for val in maxndcg_at_limits]
+        else:
+            for id_limit, metric_at_lim in enumerate(maxndcg_at_limits):
+                crawl_metrics[id_limit]["maxndcg"] = metric_at_lim
+
+    return crawl_metrics
+
 def evaluate_crawling_metrics(query_sets: list, tested_exps: dict, tested_limits: list, collection_name: str = "cw22b", compute_ub: bool = False, target_metrics: list = ["harvest"], aggregate: bool =True) -> dict:
     """
         Evaluate crawling metrics for a set of experiments and query sets.
@@ -128,45 +258,46 @@ def evaluate_crawling_metrics(query_sets: list, tested_exps: dict, tested_limits
 
     assert len(relevant_set) == len(qrels_df['doc_id'].unique()), "Error. Length mismatch for relevant documents."
 
+    # evaluation runs on integer docnos: the docids of the qrels are translated once, and the relevant documents are flagged in an array indexed by docno
+    downloads = Downloads(collection_name)
+    relevant_docnos = downloads.docids2docnos(list(relevant_set))
+    relevant_bits = np.zeros(downloads.get_numdocs(), dtype=np.uint8)
+    relevant_bits[relevant_docnos[relevant_docnos >= 0]] = 1
+
+    state = {'docno_dtype': relevant_docnos.dtype, 'num_relevant': len(relevant_set), 'target_metrics': target_metrics, 'aggregate': aggregate}
+    if "maxndcg" in target_metrics:
+        # distinct (query, relevant document) pairs in the order of the qrels, with queries encoded as integer codes (-1 docnos are never downloaded)
+        query_doc_pairs = qrels_df[['query_id', 'doc_id']].drop_duplicates(ignore_index=True)
+        qid_codes, qids = pd.factorize(query_doc_pairs['query_id'])
+        rel_docnos = downloads.docids2docnos(query_doc_pairs['doc_id'].tolist())
+        state.update(qid_codes=qid_codes, num_qids=len(qids), rel_docnos=rel_docnos, cum_inv_log2=_cum_inv_log2(len(query_doc_pairs)))
+
     if compute_ub:
         n_relevant = len(qrels_df['doc_id'].unique())
         assert len(qrels_df) == n_relevant, "Error: qrels_df contains some duplicates."
     
-    for exp_name in tested_exps.keys(): # iterate over the experiments (crawlers)
-        all_crawl_metrics[exp_name] = []
-
-        # load the list of downloads (max limit)
-        downl_docids = _load_downloads(exp_name=exp_name, max_limit=max(tested_limits), collection_name=collection_name)
-
-        if len(downl_docids) < max(tested_limits):
-            tested_limits[tested_limits.index(max(tested_limits))] = len(downl_docids)
-
-
-        if ("harvest" in target_metrics) or ("recall" in target_metrics) or ("irr_ratio" in target_metrics) or ("nrel" in target_metrics):
-            all_crawl_metrics[exp_name] = _crawling_stats(downl_docids=downl_docids, relevant_set=relevant_set, target_metrics=target_metrics, tested_limits=tested_limits)
-
-        if "maxndcg" in target_metrics:
-            maxndcg_at_limits = []
-            qids = qrels_df['query_id'].unique()
-            for limit in tested_limits:
-                downloaded_set = set(downl_docids[:limit])
-
-                all_maxndcg = []
-                for query_id in qids:
-                    relevant = set(qrels_df[qrels_df['query_id'] == query_id]["doc_id"].unique().tolist())
-                    downloaded_relevant = len(relevant.intersection(downloaded_set))
-                    all_maxndcg.append(_maxndcg(downloaded_relevant))
-                
-                if aggregate:
-                    maxndcg_at_limits.append(sum(all_maxndcg)/len(all_maxndcg))
-                else:
-                    maxndcg_at_limits.append(all_maxndcg)
-            
-            if len(all_crawl_metrics[exp_name]) == 0:
-                all_crawl_metrics[exp_name] = [{"maxndcg": val} for val in maxndcg_at_limits]
-            else:
-                for id_limit, metric_at_lim in enumerate(maxndcg_at_limits):
-                    all_crawl_metrics[exp_name][id_limit]["maxndcg"] = metric_at_lim
+    # experiments (crawlers) are independent, so they are evaluated in parallel by a pool of processes
+    exp_names = list(tested_exps.keys())
+    # each experiment is evaluated at the limits clamped by the number of downloads of the previous ones and its own,
+    # as done when they were evaluated sequentially, so the clamped limits are computed before submitting any work
+    exp_limits = []
+    for exp_name in exp_names:
+        num_downloads = _count_downloads(exp_name=exp_name, max_limit=max(tested_limits))
+        if num_downloads < max(tested_limits):
+            tested_limits[tested_limits.index(max(tested_limits))] = num_downloads
+        exp_limits.append(list(tested_limits))
+    max_workers = max(1, min(len(exp_names), os.cpu_count() or 1))
+    # the relevant flags are shared with the workers through a block of shared memory, only its name is sent
+    shm = SharedMemory(create=True, size=max(1, relevant_bits.nbytes))
+    try:
+        np.ndarray(relevant_bits.shape, dtype=np.uint8, buffer=shm.buf)[:] = relevant_bits
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_eval_worker, initargs=(state, (shm.name, relevant_bits.shape))) as executor:
+            futures = [executor.submit(_evaluate_experiment, exp_name, limits) for exp_name, limits in zip(exp_names, exp_limits)]
+            for exp_name, future in zip(exp_names, futures):
+                all_crawl_metrics[exp_name] = future.result()
+    finally:
+        shm.close()
+        shm.unlink()
 
     if compute_ub:
         return all_crawl_metrics, ubs_hr
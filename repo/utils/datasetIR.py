@@ -1,8 +1,17 @@
 import pickle, zlib
+try:
+    import zstandard # faster decompression of url2docids files, used if available
+except ImportError:
+    zstandard = None
 import os
+import shutil
+import hashlib
 import numpy as np
+import pandas as pd
+import csv
 import sys
 from collections import defaultdict
+from functools import lru_cache
 from tqdm import tqdm
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
@@ -10,10 +19,242 @@ from utils.config import config
 DOWNLOADS_FNAME = config.get('paths').get('downloaded_pages_fprefix')
 QSCORERS_CHECKPOINTS = config.get('qscorer').get('checkpoints')
 
+URL_INDEX_SUFFIX = ".index"
+SOURCE_KEY_FNAME = "source.key" # file of an index storing the key of the file it was built from
+
+MAPPINGS_CACHE_SIZE = 4 # number of loaded files kept in memory by the cached loaders
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd' # leading bytes of a zstd frame
+
+
+def hash_url(url: str) -> int:
+    """
+        Compute a stable 64-bit hash of a URL.
+
+        Args:
+            url: URL to hash
+    """
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def source_key(fpath: str) -> str:
+    """
+        Compute a key identifying the current version of a file, from its path, size and modification time.
+        Artifacts derived from the file store the key, so that they are rebuilt when the file changes.
+
+        Args:
+            fpath: path to the file
+    """
+    stat = os.stat(fpath)
+    return hashlib.sha1(repr((os.path.abspath(fpath), stat.st_size, stat.st_mtime_ns)).encode()).hexdigest()
+
+
+def build_url2ids_index(url2docids: dict, index_dir: str, key: str = "") -> None:
+    """
+        Write a compact on-disk index of the url2docids mapping, that can be memory-mapped by MmapURLMapping.
+        Docnos follow the iteration order of url2docids, as in parse_url2docnos.
+        The index is written to a temporary directory and moved into place once complete, so that a crash never leaves a partial index.
+
+        Args:
+            url2docids: dict that maps URLs to docids
+            index_dir: path to the directory where the index files will be written
+            key: source key of the url2docids file, stored in the index (see source_key)
+    """
+    final_dir = index_dir
+    index_dir = f"{final_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.makedirs(index_dir)
+    num_docs = len(url2docids)
+
+    offsets = np.zeros(num_docs + 1, dtype=np.int64)
+    keys = np.empty(num_docs, dtype=np.uint64)
+    with open(os.path.join(index_dir, "urls.dat"), 'wb', buffering=1<<20) as f: # concatenated URLs, in docno order
+        for docno, url in enumerate(url2docids):
+            encoded_url = url.encode('utf-8')
+            f.write(encoded_url)
+            offsets[docno + 1] = offsets[docno] + len(encoded_url)
+            keys[docno] = hash_url(url)
+
+    order = np.argsort(keys, kind='stable')
+    offsets.tofile(os.path.join(index_dir, "offsets.i64"))
+    keys[order].tofile(os.path.join(index_dir, "keys.u64"))
+    order.astype(np.int64).tofile(os.path.join(index_dir, "order.i64"))
+
+    docids = np.array(list(url2docids.values()), dtype=np.bytes_) # fixed-width docids, in docno order
+    with open(os.path.join(index_dir, "docids.dtype"), 'w') as f:
+        f.write(docids.dtype.str)
+    docids.tofile(os.path.join(index_dir, "docids.dat"))
+    with open(os.path.join(index_dir, SOURCE_KEY_FNAME), 'w') as f:
+        f.write(key)
+
+    # replace a stale index, if any, by renaming it away first (a directory cannot be replaced while non-empty)
+    stale_dir = f"{final_dir}.{os.getpid()}.stale"
+    if os.path.exists(final_dir):
+        os.replace(final_dir, stale_dir)
+    os.replace(index_dir, final_dir)
+    shutil.rmtree(stale_dir, ignore_errors=True)
+
+
+def get_url2ids_index(url2docids_fpath: str) -> str:
+    """
+        Return the directory of the on-disk index of a url2docids file, building it if it is missing or was built from another version of the file.
+
+        Args:
+            url2docids_fpath: path to the file containing the dictionary mapping URLs to docids
+    """
+    index_dir = url2docids_fpath + URL_INDEX_SUFFIX
+    key = source_key(url2docids_fpath)
+    try:
+        with open(os.path.join(index_dir, SOURCE_KEY_FNAME), 'r') as f:
+            up_to_date = f.read() == key
+    except OSError:
+        up_to_date = False
+    if not up_to_date:
+        build_url2ids_index(load_url2docids(url2docids_fpath), index_dir, key=key)
+    return index_dir
+
+
+class MmapURLMapping:
+    """
+        Read-only mapping from URLs to docids (or docnos) backed by the memory-mapped files written by build_url2ids_index.
+        Lookups binary-search the sorted 64-bit URL hashes, so loading is near-instantaneous and forked processes share the pages.
+    """
+
+    def __init__(self, index_dir: str, value: str = "docid") -> None:
+        """
+            Memory-map the index stored in index_dir.
+
+            Args:
+                index_dir: path to the directory storing the index files
+                value: either "docid" or "docno", the value returned by lookups
+        """
+        if value not in ("docid", "docno"):
+            raise ValueError(f"Error: value={value} not supported.")
+        self.value = value
+
+        self.urls = np.memmap(os.path.join(index_dir, "urls.dat"), dtype=np.uint8, mode='r')
+        self.offsets = np.memmap(os.path.join(index_dir, "offsets.i64"), dtype=np.int64, mode='r')
+        self.keys = np.memmap(os.path.join(index_dir, "keys.u64"), dtype=np.uint64, mode='r')
+        self.order = np.memmap(os.path.join(index_dir, "order.i64"), dtype=np.int64, mode='r')
+        with open(os.path.join(index_dir, "docids.dtype"), 'r') as f:
+            docids_dtype = np.dtype(f.read().strip())
+        self.docids = np.memmap(os.path.join(index_dir, "docids.dat"), dtype=docids_dtype, mode='r')
+
+    def url2docno(self, url: str) -> int | None:
+        """
+            Return the docno of a URL, or None if the URL is not in the mapping.
+
+            Args:
+                url: URL to look up
+        """
+        key = np.uint64(hash_url(url))
+        encoded_url = url.encode('utf-8')
+        pos = int(np.searchsorted(self.keys, key))
+        while pos < len(self.keys) and self.keys[pos] == key: # resolve hash collisions by comparing URLs
+            docno = int(self.order[pos])
+            if self.urls[self.offsets[docno]:self.offsets[docno + 1]].tobytes() == encoded_url:
+                return docno
+            pos += 1
+        return None
+
+    def docno2url(self, docno: int) -> str:
+        """
+            Return the URL of a docno.
+
+            Args:
+                docno: docno of the document
+        """
+        return self.urls[self.offsets[docno]:self.offsets[docno + 1]].tobytes().decode('utf-8')
+
+    def docno2docid(self, docno: int) -> str:
+        """
+            Return the docid of a docno.
+
+            Args:
+                docno: docno of the document
+        """
+        return self.docids[docno].decode('utf-8')
+
+    def get(self, url: str, default=None):
+        """
+            Return the docid (or docno) of a URL, or default if the URL is not in the mapping.
+
+            Args:
+                url: URL to look up
+                default: value returned for missing URLs
+        """
+        docno = self.url2docno(url)
+        if docno is None:
+            return default
+        return docno if self.value == "docno" else self.docno2docid(docno)
+
+    def __getitem__(self, url: str):
+        value = self.get(url)
+        if value is None:
+            raise KeyError(url)
+        return value
+
+    def __contains__(self, url: str) -> bool:
+        return self.url2docno(url) is not None
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for docno in range(len(self)):
+            yield self.docno2url(docno)
+
+
+class MmapDocnoMapping:
+    """
+        Read-only mapping from docnos to URLs (or docids) backed by the memory-mapped files of a MmapURLMapping.
+        It exposes the dict interface used by the docno2urls and docno2docids mappings.
+    """
+
+    def __init__(self, url_mapping: MmapURLMapping, value: str = "docid") -> None:
+        """
+            Wrap the memory-mapped index of url_mapping.
+
+            Args:
+                url_mapping: memory-mapped url mapping storing the index
+                value: either "url" or "docid", the value returned by lookups
+        """
+        if value not in ("url", "docid"):
+            raise ValueError(f"Error: value={value} not supported.")
+        self.lookup = url_mapping.docno2url if value == "url" else url_mapping.docno2docid
+        self.docids = url_mapping.docids # fixed-width docids in docno order, used for bulk translations
+        self.num_docs = len(url_mapping)
+
+    def get(self, docno: int, default=None):
+        """
+            Return the URL (or docid) of a docno, or default if the docno is not in the mapping.
+
+            Args:
+                docno: docno to look up
+                default: value returned for missing docnos
+        """
+        if docno not in self:
+            return default
+        return self.lookup(int(docno))
+
+    def __getitem__(self, docno: int):
+        if docno not in self:
+            raise KeyError(docno)
+        return self.lookup(int(docno))
+
+    def __contains__(self, docno: int) -> bool:
+        return isinstance(docno, (int, np.integer)) and 0 <= docno < self.num_docs
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def __iter__(self):
+        return iter(range(self.num_docs))
+
 
 def load_url2docids(url2docids_fpath: str) -> dict:
     """
         Load url2docids mapping from file, used to map a URL to a docid for a given Web document.
+        The file stores either the pickled dict or a pickled (urls, docids) pair of parallel lists, zlib, gzip or zstd compressed.
         Returns a dict that can be used to map URLs to docids.
 
         Args:
@@ -26,23 +267,40 @@ def load_url2docids(url2docids_fpath: str) -> dict:
     except Exception as e:
         raise RuntimeError(f"Error reading file={url2docids_fpath}: {e}")
     
+    if compressed_url2docid.startswith(ZSTD_MAGIC) and zstandard is None:
+        raise RuntimeError(f"Error: file={url2docids_fpath} is zstd compressed, but zstandard is not installed.")
+
     try:
-        decompressed_url2docid = pickle.loads(zlib.decompress(compressed_url2docid))
+        if compressed_url2docid.startswith(ZSTD_MAGIC):
+            # decompressobj does not need the content size, which streamed frames do not store
+            decompressed_url2docid = pickle.loads(zstandard.ZstdDecompressor().decompressobj().decompress(compressed_url2docid))
+        else:
+            # wbits with 32 added detects the header, so both zlib and gzip compressed files are supported
+            decompressed_url2docid = pickle.loads(zlib.decompress(compressed_url2docid, wbits=zlib.MAX_WBITS | 32))
     except Exception as e:
         raise RuntimeError(f"Error decompressing file={url2docids_fpath}: {e}")
     
+    if isinstance(decompressed_url2docid, tuple):
+        urls, docids = decompressed_url2docid
+        decompressed_url2docid = dict(zip(urls, docids))
+
     return decompressed_url2docid
 
 
-def parse_url2docnos(url2docids: dict) -> dict:
+def parse_url2docnos(url2docids: dict, intern: bool = False) -> dict:
     """
         Parse url2docnos mapping out of url2docids mapping.
         Given the dict that maps URLs to docids, returns a dict that can be used to map URLs to docnos.
+        If intern is True, the URLs are interned, so that lookups with interned URLs match keys by identity.
 
         Args:
             url2docids: dict that maps URLs to docids
+            intern: boolean flag to intern the URLs used as keys
     """
-    url2docnos = {url: index for index, url in enumerate(url2docids)}
+    if intern:
+        url2docnos = {sys.intern(url): index for index, url in enumerate(url2docids)}
+    else:
+        url2docnos = {url: index for index, url in enumerate(url2docids)}
 
     if len(url2docids) != len(url2docnos):
         raise ValueError("Error: url2docids and url2docnos have different lengths.")
@@ -67,39 +325,119 @@ def parse_docno2urls(url2docids: dict) -> tuple:
     return docno2urls, docno2docids
 
 
-def load_collection_url2ids_mappings(url2docids_fpath: str) -> tuple:
+def parse_docids2docnos(docids: list, docno2docids) -> np.ndarray:
+    """
+        Translate docids to docnos with a single hashed lookup over the docids of the collection.
+        Returns an array of int32 docnos (int64 for collections that do not fit), with -1 for the docids not in the collection.
+
+        Args:
+            docids: list of docids to translate
+            docno2docids: mapping from docnos to docids, as returned by load_collection_docnos_mappings
+    """
+    num_docs = len(docno2docids)
+    docno_dtype = np.int32 if num_docs <= np.iinfo(np.int32).max else np.int64
+    if isinstance(docno2docids, MmapDocnoMapping):
+        # match the raw bytes of the memory-mapped docids, instead of decoding all of them
+        collection_docids = pd.Index(docno2docids.docids)
+        docids = [docid.encode('utf-8') for docid in docids]
+    else:
+        # docnos are assigned in the iteration order of the mapping, see parse_docno2urls
+        collection_docids = pd.Index(list(docno2docids.values()))
+    return collection_docids.get_indexer(docids).astype(docno_dtype)
+
+
+def load_collection_url2ids_mappings(url2docids_fpath: str, mmap: bool = False, intern: bool = False) -> tuple:
     """
         Load from file all the mappings that map URL to docids, and URL to docnos.
+        If mmap is True, the mappings are memory-mapped from an on-disk index, built on first use.
 
         Args:
             url2docids_fpath: path to the file containing the dictionary mapping URLs to docids
+            mmap: boolean flag to memory-map the mappings instead of loading them into dicts
+            intern: boolean flag to intern the URLs of the in-memory mappings (ignored if mmap is True)
     """
+    if mmap:
+        index_dir = get_url2ids_index(url2docids_fpath)
+        return MmapURLMapping(index_dir, value="docid"), MmapURLMapping(index_dir, value="docno")
+
     url2docids = load_url2docids(url2docids_fpath)
-    url2docnos = parse_url2docnos(url2docids)
+    url2docnos = parse_url2docnos(url2docids, intern=intern)
     return url2docids, url2docnos
 
 
-def load_collection_docnos_mappings(url2docids_fpath: str) -> tuple:
+@lru_cache(maxsize=MAPPINGS_CACHE_SIZE)
+def load_collection_docnos_mappings(url2docids_fpath: str, mmap: bool = False) -> tuple:
     """
         Load from file all the mappings that map docno to URLs, and docno to docids.
+        If mmap is True, the mappings are memory-mapped from the on-disk index of load_collection_url2ids_mappings, built on first use.
+        Results are cached by path and shared between callers, which must not modify them.
 
         Args:
             url2docids_fpath: path to the file containing the dictionary mapping URLs to docids
+            mmap: boolean flag to memory-map the mappings instead of loading them into dicts
     """
+    if mmap:
+        index_dir = get_url2ids_index(url2docids_fpath)
+        url_mapping = MmapURLMapping(index_dir)
+        return MmapDocnoMapping(url_mapping, value="url"), MmapDocnoMapping(url_mapping, value="docid")
+
     url2docids = load_url2docids(url2docids_fpath)
     docno2urls, docno2docids = parse_docno2urls(url2docids)
     return docno2urls, docno2docids
 
 
-def load_downloaded_list(downloaded_dir: str, limit: int | None = None) -> list:
+def count_downloaded_list(downloaded_dir: str, limit: int | None = None) -> int:
+    """
+        Count the docnos of downloaded documents stored in downloaded_dir by the fetcher, as returned by load_downloaded_list.
+        Only the headers of the chunked files are read.
+
+        Args:
+            downloaded_dir: path to the directory containing the downloaded docids
+            limit: maximum number of downloaded docids to count
+    """
+    downloaded_fpath = os.path.join(downloaded_dir, f"{DOWNLOADS_FNAME}.npy")
+    if os.path.exists(downloaded_fpath): # single file written in place by the fetcher, -1 marks unused slots
+        downloaded = np.load(downloaded_fpath, mmap_mode='r')
+        unused = np.flatnonzero(downloaded < 0)
+        num_downloaded = int(unused[0]) if len(unused) > 0 else len(downloaded)
+    else:
+        num_downloaded = 0
+        chunk_idx = 1
+        while not (limit and num_downloaded >= limit):
+            downloaded_fpath = os.path.join(downloaded_dir, f"{DOWNLOADS_FNAME}_{chunk_idx}.npy")
+            if not os.path.exists(downloaded_fpath):
+                break
+            with open(downloaded_fpath, 'rb') as f:
+                major, _ = np.lib.format.read_magic(f)
+                read_header = np.lib.format.read_array_header_1_0 if major == 1 else np.lib.format.read_array_header_2_0
+                shape, _, _ = read_header(f)
+            num_downloaded += shape[0]
+            chunk_idx += 1
+    return min(num_downloaded, limit) if limit else num_downloaded
+
+
+def load_downloaded_list(downloaded_dir: str, limit: int | None = None) -> np.ndarray:
     """
-        Load the list docids of of downloaded documents stored in downloaded_dir by the fetcher
+        Load the array of docnos of downloaded documents stored in downloaded_dir by the fetcher.
+        Docnos are kept in a contiguous numpy array rather than converted to a list of Python ints.
 
         Args:
             downloaded_dir: path to the directory containing the downloaded docids
             limit: maximum number of downloaded docids to load
     """
-    downloaded_docnos = []
+    downloaded_fpath = os.path.join(downloaded_dir, f"{DOWNLOADS_FNAME}.npy")
+    if os.path.exists(downloaded_fpath): # single file written in place by the fetcher, -1 marks unused slots
+        downloaded = np.load(downloaded_fpath, mmap_mode='r')
+        unused = np.flatnonzero(downloaded < 0)
+        num_downloaded = int(unused[0]) if len(unused) > 0 else len(downloaded)
+        if limit:
+            num_downloaded = min(num_downloaded, limit)
+        downloaded_docnos = np.array(downloaded[:num_downloaded]) # copy out of the memory map
+        print(f"Loaded {len(downloaded_docnos)} docnos in dir={downloaded_dir}.")
+        return downloaded_docnos
+
+    chunks = []
+    num_loaded = 0
 
     chunk_idx = 1
     with tqdm(desc="Loading chunks of downloaded docids") as pbar:
@@ -108,18 +446,24 @@ def load_downloaded_list(downloaded_dir: str, limit: int | None = None) -> list:
         
             if not os.path.exists(downloaded_fpath):
                 print(f"File={downloaded_fpath} does not exist.")
-                return downloaded_docnos
+                break
             
             try:
-                downloaded_docnos += np.load(downloaded_fpath, allow_pickle=True, mmap_mode='r').tolist()
+                chunk = np.load(downloaded_fpath, allow_pickle=True)
             except:
                 raise RuntimeError(f"Error reading file={downloaded_fpath}.")
+            chunks.append(chunk)
+            num_loaded += len(chunk)
             
             chunk_idx += 1
             pbar.update(1)
-            if limit and len(downloaded_docnos) >= limit:
-                downloaded_docnos = downloaded_docnos[:limit]
+            if limit and num_loaded >= limit:
                 break
+
+    # concatenate the chunks once, instead of growing a list of Python ints chunk by chunk
+    downloaded_docnos = np.concatenate(chunks) if len(chunks) > 0 else np.empty(0, dtype=np.int64)
+    if limit:
+        downloaded_docnos = downloaded_docnos[:limit]
         
     print(f"Loaded {len(downloaded_docnos)} docnos in dir={downloaded_dir}.")
 
@@ -131,40 +475,47 @@ def load_downloaded_list(downloaded_dir: str, limit: int | None = None) -> list:
     return downloaded_docnos
 
 
-def load_qrels(qrels_fpath: str, with_click: bool = False) -> list:
+@lru_cache(maxsize=MAPPINGS_CACHE_SIZE)
+def load_qrels(qrels_fpath: str, with_click: bool = False) -> pd.DataFrame:
     """
-        Load the qrels from the file at qrels_fpath.
+        Load the qrels from the file at qrels_fpath, parsed by the C parser of pandas.
         If with_click is True, the relevance is the click value, otherwise it is 1.
-        Returns a list of dicts, in which each dict has the keys: query_id, doc_id, relevance.
+        Returns a DataFrame with the columns: query_id, doc_id, relevance.
+        Results are cached by path and shared between callers, which must not modify them.
     
         Args:
             qrels_fpath: path to the file containing the qrels
             with_click: boolean flag to indicate whether the relevance is the click value
     """
-    qrels = []
-    with open(qrels_fpath, 'r') as file:
-        for line in file:
-            columns = line.strip().split('\t')
-            qid, docid = columns[0], columns[1]
-            relevance = columns[2] if with_click else 1
-            qrels.append({"query_id": qid, "doc_id": docid, "relevance": relevance})
-    return qrels
+    qrels_df = read_tsv(qrels_fpath, names=['query_id', 'doc_id', 'click'])
+    qrels_df['relevance'] = qrels_df['click'] if with_click else 1
+    return qrels_df[['query_id', 'doc_id', 'relevance']]
 
 
-def load_queries(queries_fpath: str) -> list:
+@lru_cache(maxsize=MAPPINGS_CACHE_SIZE)
+def load_queries(queries_fpath: str) -> pd.DataFrame:
     """
-        Load the queries from the file at queries_fpath.
-        Returns a list of dicts, in which each dict has the keys: qid, query.
+        Load the queries from the file at queries_fpath, parsed by the C parser of pandas.
+        Returns a DataFrame with the columns: qid, query.
+        Results are cached by path and shared between callers, which must not modify them.
 
         Args:
             queries_fpath: path to the file containing the queries
     """
-    queries = []
-    with open(queries_fpath, 'r') as file:
-        for line in file:
-            qid, query = line.strip().split('\t')
-            queries.append({"qid": qid, "query": query})
-    return queries
+    return read_tsv(queries_fpath, names=['qid', 'query'])
+
+
+def read_tsv(fpath: str, names: list) -> pd.DataFrame:
+    """
+        Read a headerless TSV file as strings with the C parser of pandas.
+        Quotes are not interpreted and empty fields are kept as empty strings, as when splitting each line on tabs.
+
+        Args:
+            fpath: path to the TSV file
+            names: names of the columns of the file
+    """
+    return pd.read_csv(fpath, sep='\t', header=None, names=names, dtype=str, engine='c',
+                       quoting=csv.QUOTE_NONE, keep_default_na=False)
 
 
 def load_ranking_list(run_fpath: str, topk: int) -> dict:
@@ -176,19 +527,10 @@ def load_ranking_list(run_fpath: str, topk: int) -> dict:
             run_fpath: path to the file containing the ranking list
             topk: top-k value to consider
     """
-    rankings = defaultdict(list)
-
-    with open(run_fpath, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if not line:  # skip empty lines
-                continue
-            cols = line.split()
-    
-            qid, _, docid, rank = cols[0], cols[1], cols[2], int(cols[3])
-            
-            if rank <= topk:
-                rankings[qid].append(docid)
+    run_df = pd.read_csv(run_fpath, sep=r'\s+', header=None, usecols=[0, 2, 3], names=['qid', 'docid', 'rank'],
+                         dtype={'qid': str, 'docid': str, 'rank': np.int64}, engine='c', quoting=csv.QUOTE_NONE, keep_default_na=False)
+    run_df = run_df[run_df['rank'].to_numpy() <= topk]
+    rankings = defaultdict(list, run_df.groupby('qid', sort=False)['docid'].agg(list).to_dict())
 
     print(f"Loaded {len(rankings)} rankings.")
     return rankings
\ No newline at end of file
@@ -1,6 +1,6 @@
-#from queue import PriorityQueue
 import heapq
-from queue import PriorityQueue
+import itertools
+from collections import deque
 from abc import ABC, abstractmethod
 
 class PQueue(ABC):
@@ -36,6 +36,17 @@ class PQueue(ABC):
         """
         pass
 
+    def put_batch(self, items: list, priorities: list) -> None:
+        """
+            Put a batch of items in the priority queue with their priorities
+
+            Args:
+                items: the objects to be enqueued
+                priorities: the priorities of the items
+        """
+        for item, priority in zip(items, priorities):
+            self.put(item, priority)
+
     @abstractmethod
     def update(self, item: object, priority: float) -> None:
        """
@@ -64,6 +75,9 @@ class PQueue(ABC):
 class PQueueHeap(PQueue):
     """
         Class for a max-heap priority queue using heapq.
+        The heap position of each item is only tracked after the first update, so that queues without updates keep the C heapq functions.
+        Items are assumed to be enqueued at most once.
+        Entries are (internal priority, count, item), so that ties are broken by insertion order without comparing the items.
     """
 
     def __init__(self):
@@ -72,7 +86,57 @@ class PQueueHeap(PQueue):
         """
         super().__init__()
         self.queue = [] # heapq queue
+        self.index = None # position of each item in the queue, built by the first update
+        self.counter = itertools.count() # tiebreaker of the entries with the same priority
     
+    def _siftdown(self, startpos: int, pos: int) -> None:
+        """
+            Move the entry at pos towards the root (startpos) until its parent has a higher priority, as heapq._siftdown, keeping the index up to date.
+
+            Args:
+                startpos: position of the root of the sub-heap
+                pos: position of the entry to be moved
+        """
+        heap, index = self.queue, self.index
+        newitem = heap[pos]
+        while pos > startpos:
+            parentpos = (pos - 1) >> 1
+            parent = heap[parentpos]
+            if newitem < parent:
+                heap[pos] = parent
+                index[parent[2]] = pos
+                pos = parentpos
+                continue
+            break
+        heap[pos] = newitem
+        index[newitem[2]] = pos
+
+    def _siftup(self, pos: int) -> None:
+        """
+            Move the entry at pos down to a leaf along the children with the highest priority, then back up to its place, as heapq._siftup, keeping the index up to date.
+            Children are shifted into the hole left by the entry, which is written once at its final position.
+
+            Args:
+                pos: position of the entry to be moved
+        """
+        heap, index = self.queue, self.index
+        endpos = len(heap)
+        startpos = pos
+        newitem = heap[pos]
+        childpos = 2 * pos + 1
+        while childpos < endpos:
+            rightpos = childpos + 1
+            if rightpos < endpos and not heap[childpos] < heap[rightpos]:
+                childpos = rightpos
+            child = heap[childpos]
+            heap[pos] = child
+            index[child[2]] = pos
+            pos = childpos
+            childpos = 2 * pos + 1
+        heap[pos] = newitem
+        index[newitem[2]] = pos
+        self._siftdown(startpos, pos)
+
     def put(self, item: object, priority: float) -> None:
       """
             Put an item in the priority queue with a specific priority
@@ -81,34 +145,75 @@ class PQueueHeap(PQueue):
                 item: the object to be enqueued
                 priority: the priority of the item
         """
-      heapq.heappush(self.queue, (self._internal_priority(priority), item))
+      if self.index is None:
+          heapq.heappush(self.queue, (self._internal_priority(priority), next(self.counter), item))
+      else:
+          self.queue.append((self._internal_priority(priority), next(self.counter), item))
+          self._siftdown(0, len(self.queue) - 1)
+
+    def put_batch(self, items: list, priorities: list) -> None:
+        """
+            Put a batch of items in the priority queue with their priorities.
+            Large batches are appended and the heap is rebuilt in linear time, small ones are pushed one by one.
+
+            Args:
+                items: the objects to be enqueued
+                priorities: the priorities of the items
+        """
+        entries = [(self._internal_priority(priority), next(self.counter), item) for item, priority in zip(items, priorities)]
+        size = len(self.queue) + len(entries)
+        if len(entries) * size.bit_length() > size: # k log(n+k) > n+k
+            self.queue.extend(entries)
+            heapq.heapify(self.queue)
+            if self.index is not None:
+                self.index = {item: i for i, (_, _, item) in enumerate(self.queue)}
+        elif self.index is None:
+            for entry in entries:
+                heapq.heappush(self.queue, entry)
+        else:
+            for entry in entries:
+                self.queue.append(entry)
+                self._siftdown(0, len(self.queue) - 1)
     
     def update(self, item: object, priority: float) -> None:
         """
-            Insert item in set of removed items and re-heapify the queue.
+            Increase the priority of an item, if the new priority is higher, and move it up the heap in O(log n).
 
             Args:
                 item: the object to be updated
                 priority: the new priority of the item
         """
-        old_priority = None
-        for i in range(len(self.queue)): # process all items in the queue
-            if self.queue[i][1] == item: # search the item in the queue
-                old_priority = self.queue[i][0] # get current priority
-                if self._external_priority(old_priority) < priority: # update priority if necesasry
-                    self.queue[i] = (self._internal_priority(priority), item)
-                    heapq.heapify(self.queue) # re-heapify the queue
-                break
+        if self.index is None: # start tracking the positions of the items
+            self.index = {item: i for i, (_, _, item) in enumerate(self.queue)}
+        i = self.index.get(item)
+        if i is None:
+            return
+        if self._external_priority(self.queue[i][0]) < priority: # update priority if necesasry
+            self.queue[i] = (self._internal_priority(priority), next(self.counter), item)
+            self._siftdown(0, i) # a higher priority can only move the item towards the root
 
     def get(self) -> tuple:
         """
             Pop the item with the highest priority and return both the item and its priority.
         """
-        try:
-            item =  heapq.heappop(self.queue)  
-            return item[1], item[0] 
-        except IndexError:
+        if self.index is None:
+            try:
+                item =  heapq.heappop(self.queue)  
+                return item[2], item[0] 
+            except IndexError:
+                raise KeyError('Trying to pop from an empty priority queue')
+
+        if not self.queue:
             raise KeyError('Trying to pop from an empty priority queue')
+        last = self.queue.pop()
+        if self.queue:
+            item = self.queue[0]
+            self.queue[0] = last
+            self._siftup(0)
+        else:
+            item = last
+        del self.index[item[2]]
+        return item[2], item[0]
     
     def enqueued(self) -> int:
         """
@@ -120,38 +225,58 @@ class PQueueHeap(PQueue):
         """
             Get the list of all items in the priority queue
         """
-        num_enqueued = self.enqueued()
-        items = [item for priority,  item in self.queue]
-        assert num_enqueued == len(items), f"Error, num_enqueued={num_enqueued} != len(items)={len(items)}"
-        return items
+        return [item for priority, count, item in self.queue]
 
 class PQueuePriorityQueue(PQueue):
     """
-        Class for a max-heap priority queue using PriorityQueue.
+        Class for a max-heap priority queue using heapq on a plain list, without the locks of queue.PriorityQueue (the frontier is single-threaded).
+        Updates only increase priorities and use lazy invalidation: a new entry is pushed with a fresh version,
+        and entries whose version is not the latest one of their item are discarded when popped.
+        Versions are unique, so they also break ties by insertion order without comparing the items.
     """
-    MAX_DELETED_THRESHOLD = 10_000_000
+    MIN_DELETED_THRESHOLD = 1024 # stale entries tolerated whatever the size of the queue
+    CLEANUP_RATIO = 1.0 # stale entries tolerated per enqueued item, so that the queue stays within (1 + ratio) times its live size
 
     def __init__(self):
         """"
             Constructor of the priority queue.
         """
-        self.queue = PriorityQueue()
-        self.deleted = {} # lazy deletion set
+        self.queue = [] # heapq queue of entries (internal priority, version, item)
+        self.del_prio = {} # latest internal priority of each enqueued item
+        self.del_version = {} # latest version of each enqueued item, in a parallel dict so that no record is allocated per push
         self.num_enqueued = 0
-        self.num_deleted = 0
-        if self.enqueued() != (self.queue.qsize() - self.num_deleted):
-            raise ValueError(f"Error: enqueued()={self.enqueued()} != queue.qsize() - num_deleted = {self.queue.qsize()} - {self.num_deleted}")
+        self.num_deleted = 0 # number of stale entries in the queue
+        self.version = 0 # version of the last pushed entry
+
+    def _check_invariants(self) -> None:
+        """
+            Check that the counters are consistent with the queue (used by tests, not on the hot path).
+        """
+        if self.enqueued() != (len(self.queue) - self.num_deleted):
+            raise ValueError(f"Error: enqueued()={self.enqueued()} != len(queue) - num_deleted = {len(self.queue)} - {self.num_deleted}")
+        if self.enqueued() != len(self.del_version):
+            raise ValueError(f"Error: enqueued()={self.enqueued()} != number of live items = {len(self.del_version)}")
     
+    def _push(self, item: object, internal_priority: float) -> None:
+        """
+            Push a new entry of an item with a fresh version and record it as the latest one.
+
+            Args:
+                item: the object to be enqueued
+                internal_priority: the internal priority of the item
+        """
+        self.version += 1
+        heapq.heappush(self.queue, (internal_priority, self.version, item))
+        self.del_prio[item] = internal_priority
+        self.del_version[item] = self.version
+
     def put(self, item: object, priority: float) -> None:
         """
             Put an item in the priority queue with a specific priority
         """
-        if item in self.deleted:
+        if item in self.del_version:
             assert False, "Error, trying to put an item that is already in the deleted"
-        internal_priority = self._internal_priority(priority)
-        self.queue.put((internal_priority, item))
-    
-        self.deleted[item] = {"priority": internal_priority, "count": 0}
+        self._push(item, self._internal_priority(priority))
         self.num_enqueued += 1
 
     def remove(self, item: object) -> None:
@@ -161,31 +286,32 @@ class PQueuePriorityQueue(PQueue):
             Args:
                 item: the object to be removed
         """
-        self._mark_deleted(item, float('-inf'))
+        if self.del_version.pop(item, None) is None:
+            return
+        del self.del_prio[item]
+        self.num_deleted += 1 # its entry in the queue becomes stale
         self.num_enqueued -= 1
 
     def update(self, item: object, priority: float) -> bool:
         """
-            Update the priority of an item in the priority queue.
-            Returns True if the item was updated, False otherwise.
+            Update the priority of an item in the priority queue, if the new priority is higher than the current one.
+            Returns True if the item is enqueued, False otherwise.
 
             Args:
                 item: the object to be updated
                 priority: the new priority of the item
         """
-        if item not in self.deleted:  
+        current_priority = self.del_prio.get(item)
+        if current_priority is None:
             return False
 
-        # find the current priority of the item
-        old_priority = self.deleted[item]["priority"]
-
         # check if new priority is higher than the current one
-        if self._external_priority(old_priority) > priority:
-            self._mark_deleted(item, priority) # update priority
-            self.queue.put((self._internal_priority(priority), item)) # add new item to the queue
+        if priority > self._external_priority(current_priority):
+            self._push(item, self._internal_priority(priority)) # supersede the current entry
+            self.num_deleted += 1
             
-        # if the number of deleted items exceeds the threshold, clean up the deleted list
-        if self.num_deleted > self.MAX_DELETED_THRESHOLD:
+        # if the number of deleted items exceeds the threshold (relative to the live items), clean up the deleted list
+        if self.num_deleted > max(self.MIN_DELETED_THRESHOLD, self.CLEANUP_RATIO * self.num_enqueued):
             self._cleanup_deleted()
 
         return True
@@ -194,26 +320,17 @@ class PQueuePriorityQueue(PQueue):
         """
             Pop the item with the highest priority and return both the item and its priority.
         """
-        while not self.queue.empty(): # process the queue until it is empty
-            priority, item = self.queue.get() # get next item from the queue
-            priority = self._external_priority(priority) # convert internal priority to external priority
+        while self.queue: # process the queue until it is empty
+            priority, version, item = heapq.heappop(self.queue) # get next entry from the queue
 
-            # get the minimum priority of the item and the number of times it was deleted
-            min_del_priority, del_count = self.deleted.get(item).values()             
-            min_del_priority = self._external_priority(min_del_priority) # convert internal priority to external priority
-
-            del_count -= 1
-            if del_count < 0:
-                del self.deleted[item]
-            else:
-                self.deleted[item] = {"priority": self._internal_priority(min_del_priority), "count": del_count}
-
-            if priority > min_del_priority: # item is marked as deleted
+            if self.del_version.get(item) != version: # entry is stale
                 self.num_deleted -= 1
                 continue
-            else: # item is not marked as deleted
-                self.num_enqueued -= 1
-                return item, priority
+
+            del self.del_prio[item]
+            del self.del_version[item]
+            self.num_enqueued -= 1
+            return item, self._external_priority(priority)
 
         raise KeyError('Trying to pop from an empty priority queue')
     
@@ -223,52 +340,142 @@ class PQueuePriorityQueue(PQueue):
         """
         return self.num_enqueued
 
-    def _mark_deleted(self, item: object, priority: float) -> None:
+    def _cleanup_deleted(self) -> None:
         """
-            Mark an item as deleted without actually removing it.
-            
+            Rebuild the queue without stale entries, with a single filtering pass and a linear-time heapify.
+            Live entries keep their versions, so the latest priority and version of each item are unchanged.
+        """
+        del_version = self.del_version
+        self.queue = [entry for entry in self.queue if del_version.get(entry[2]) == entry[1]]
+        heapq.heapify(self.queue)
+        self.num_deleted = 0
+
+    def get_all_items(self) -> list:
+        """
+            Get the list of all items in the priority queue, from the highest priority, without removing them.
+        """
+        del_version = self.del_version
+        live = sorted(entry for entry in self.queue if del_version.get(entry[2]) == entry[1]) # same order as popping them
+        items = [item for priority, version, item in live]
+
+        if __debug__: # skipped under python -O
+            num_enqueued = self.enqueued()
+            assert num_enqueued == len(items), f"Error, num_enqueued={num_enqueued} != len(items)={len(items)}"
+
+        return items
+
+class PQueueBucket(PQueue):
+    """
+        Class for a max priority queue made of a fixed number of FIFO buckets over a bounded priority range.
+        Priorities are quantised to buckets, so pages in the same bucket are popped in insertion order.
+        Updates only increase priorities and are lazy: the page is re-inserted in its new bucket and stale entries are skipped when popped.
+    """
+
+    def __init__(self, min_priority: float, max_priority: float, num_buckets: int = 256):
+        """
+            Constructor of the priority queue.
+
+            Args:
+                min_priority: lowest priority, mapped to the first bucket
+                max_priority: highest priority, mapped to the last bucket
+                num_buckets: number of buckets
+        """
+        super().__init__()
+        if max_priority <= min_priority:
+            raise ValueError(f"Error: max_priority={max_priority} must be greater than min_priority={min_priority}.")
+        self.min_priority = min_priority
+        self.max_priority = max_priority
+        self.num_buckets = num_buckets
+        self.scale = (num_buckets - 1) / (max_priority - min_priority)
+        self.buckets = [deque() for _ in range(num_buckets)]
+        self.top = -1 # highest possibly non-empty bucket
+        self.bucket_of = {} # bucket of the live entry of each enqueued item
+
+    def _bucket(self, priority: float) -> int:
+        """
+            Map a priority to the index of its bucket, clipping priorities outside the range.
+
             Args:
-                item: the object to be marked as deleted
+                priority: the priority to be mapped
+        """
+        idx = int((priority - self.min_priority) * self.scale)
+        return min(max(idx, 0), self.num_buckets - 1)
+
+    def _push(self, item: object, priority: float) -> int:
+        """
+            Append an item to the bucket of its priority and return the bucket index.
+        """
+        idx = self._bucket(priority)
+        self.buckets[idx].append((item, priority))
+        if idx > self.top:
+            self.top = idx
+        return idx
+
+    def put(self, item: object, priority: float) -> None:
+        """
+            Put an item in the priority queue with a specific priority
+
+            Args:
+                item: the object to be enqueued
                 priority: the priority of the item
         """
-        old_priority, old_count = self.deleted.get(item).values()
-   
-        if priority >= self._external_priority(old_priority):
-            return
-        
-        self.deleted[item] = {"priority": self._internal_priority(priority), "count": old_count +1}
-        self.num_deleted += 1 
-        
-    def _cleanup_deleted(self) -> None:
+        self.bucket_of[item] = self._push(item, priority)
+        self.num_enqueued += 1
+
+    def update(self, item: object, priority: float) -> bool:
         """
-            Remove all items from the deleted set.
+            Update the priority of an item in the priority queue, if it moves the item to a higher bucket.
+            Returns True if the item is enqueued, False otherwise.
+
+            Args:
+                item: the object to be updated
+                priority: the new priority of the item
         """
-        old_num_enqueued = self.enqueued()
-        new_queue = PriorityQueue()
-        new_deleted = {}
-        
-        while not self.queue.empty():
-            item, priority = self.get()
-            new_queue.put((self._internal_priority(priority), item))
-        
-            new_deleted[item] = {"priority": self._internal_priority(priority), "count": 0}
+        old_idx = self.bucket_of.get(item)
+        if old_idx is None:
+            return False
+        if self._bucket(priority) > old_idx:
+            self.bucket_of[item] = self._push(item, priority)
+        return True
 
-        self.queue = new_queue
-        self.num_deleted = 0
-        self.num_enqueued = old_num_enqueued
-        self.deleted = new_deleted
-        self.num_deleted = 0
+    def get(self) -> tuple:
+        """
+            Pop the item with the highest priority and return both the item and its priority.
+        """
+        while self.top >= 0:
+            bucket = self.buckets[self.top]
+            if not bucket:
+                self.top -= 1
+                continue
+            item, priority = bucket.popleft()
+            if self.bucket_of.get(item) != self.top: # stale entry of an updated item
+                continue
+            del self.bucket_of[item]
+            self.num_enqueued -= 1
+            return item, priority
+        raise KeyError('Trying to pop from an empty priority queue')
 
-    def get_all_items(self) -> list:
+    def remove(self, item: object) -> None:
         """
-            Get the list of all items in the priority queue
+            Remove an item from the priority queue.
+            The removal is lazy: the entry of the item becomes stale and is skipped when popped.
+
+            Args:
+                item: the object to be removed
         """
-        num_enqueued = self.enqueued()
-        items = []
-        while self.enqueued() > 0:
-            item, _ = self.get()
-            items.append(item)
+        if self.bucket_of.pop(item, None) is None:
+            return
+        self.num_enqueued -= 1
 
-        assert num_enqueued == len(items), f"Error, num_enqueued={num_enqueued} != len(items)={len(items)}"
+    def enqueued(self) -> int:
+        """
+            Get the number of items in the priority queue
+        """
+        return self.num_enqueued
 
-        return items
\ No newline at end of file
+    def get_all_items(self) -> list:
+        """
+            Get the list of all items in the priority queue, from the highest priority, without removing them.
+        """
+        bucket_of = self.bucket_of
+        return [item for idx in range(self.top, -1, -1) for item, priority in self.buckets[idx] if bucket_of.get(item) == idx] # same order as popping them
@@ -1,5 +1,7 @@
 
 import sys, os
+import hashlib
+import numpy as np
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
@@ -8,6 +10,8 @@ from utils.component import Component
 from pyterrier_quality import QualCache
 
 CHECKPOINTS = config.get('qscorer').get('checkpoints', None)
+CACHE_DIR = config.get('paths', 'cache_dir', './../../data/cache/')
+QSCORES_CACHE = config.get('qscorer', 'qscores_cache', True) # snapshot the sorted docnos and scores on disk, memory-mapped by later loads
 
 class QualityScorer(Component):  
     """
@@ -33,12 +37,23 @@ class QualityScorer(Component):
    
     def load_qscores(self) -> None:
         """
-            Load quality scores from the checkpoint
+            Load quality scores from the checkpoint.
+            When enabled, the sorted arrays are snapshotted on disk and memory-mapped by later loads, which skip reading the scores
+            of the checkpoint and share the pages between processes.
         """
+        cache = QualCache.from_url(self.checkpoint) # resolves the checkpoint to a local artifact, without reading the scores
+        cache_dir = self._qscores_cache_dir(cache)
+        if QSCORES_CACHE and os.path.exists(os.path.join(cache_dir, "scores.f4")):
+            self.log(f"Memory-mapping quality scores from dir={cache_dir}.")
+            with open(os.path.join(cache_dir, "docnos.dtype"), 'r') as f:
+                docnos_dtype = np.dtype(f.read().strip())
+            self.docnos = np.memmap(os.path.join(cache_dir, "docnos.dat"), dtype=docnos_dtype, mode='r')
+            self.scores = np.memmap(os.path.join(cache_dir, "scores.f4"), dtype=np.float32, mode='r')
+            self.log(f"Loaded {len(self.scores)} quality scores.")
+            return
 
         self.log(f"Loading quality scores from checkpoint={self.checkpoint}.")
         print(f"Loading quality scores from checkpoint={self.checkpoint}.")
-        cache = QualCache.from_url(self.checkpoint)
 
         docnos = cache.docnos()
         scores = cache.quality_scores()
@@ -46,9 +61,55 @@ class QualityScorer(Component):
         self.log(f"Loaded {len(scores)} quality scores.")
         self.log(f"Loaded {len(docnos)} docnos.")
 
-        self.log(f"Creating docno2score mapping.")
-        self.docno2score = {str(docno): float(score) for docno, score in zip(docnos, scores)}
-        self.log("Done creating docno2score mapping.")
+        # docnos are kept as a sorted array of fixed-width bytes with the float32 scores in the same order, instead of a dict of boxed strings and floats
+        self.log(f"Creating sorted docnos and scores arrays.")
+        docnos = np.array([str(docno).encode('utf-8') for docno in docnos], dtype=np.bytes_)
+        order = np.argsort(docnos, kind='stable')
+        self.docnos = docnos[order]
+        self.scores = np.asarray(scores, dtype=np.float32)[order]
+        self.log("Done creating sorted docnos and scores arrays.")
+
+        if QSCORES_CACHE and len(self.scores) > 0:
+            self._save_qscores(cache_dir)
+
+    def _qscores_cache_dir(self, cache: QualCache) -> str:
+        """
+            Return the directory of the on-disk snapshot of the quality scores.
+            The key hashes the checkpoint and the path, size and modification time of each file of its local artifact,
+            so that a snapshot is never reused after the checkpoint is updated under the same name.
+
+            Args:
+                cache: quality cache resolved from the checkpoint
+        """
+        key_parts = [self.checkpoint]
+        artifact_dir = getattr(cache, 'path', None)
+        if artifact_dir is not None and os.path.isdir(artifact_dir):
+            for dirpath, dirnames, fnames in os.walk(artifact_dir):
+                dirnames.sort()
+                for fname in sorted(fnames):
+                    fpath = os.path.join(dirpath, fname)
+                    stat = os.stat(fpath)
+                    key_parts.append((os.path.abspath(fpath), stat.st_size, stat.st_mtime_ns))
+        key = hashlib.sha1(repr(key_parts).encode()).hexdigest()
+        return os.path.join(CACHE_DIR, f"qscores_{key}")
+
+    def _save_qscores(self, cache_dir: str) -> None:
+        """
+            Write the sorted docnos and scores to cache_dir.
+            Each file is written to a temporary file first, and the scores file is renamed last, so that its presence marks a complete snapshot.
+
+            Args:
+                cache_dir: directory of the snapshot
+        """
+        self.log(f"Saving quality scores to dir={cache_dir}.")
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_suffix = f".{os.getpid()}.tmp"
+        with open(os.path.join(cache_dir, "docnos.dtype" + tmp_suffix), 'w') as f:
+            f.write(self.docnos.dtype.str)
+        self.docnos.tofile(os.path.join(cache_dir, "docnos.dat" + tmp_suffix))
+        self.scores.tofile(os.path.join(cache_dir, "scores.f4" + tmp_suffix))
+        for fname in ("docnos.dtype", "docnos.dat", "scores.f4"):
+            os.replace(os.path.join(cache_dir, fname + tmp_suffix), os.path.join(cache_dir, fname))
 
     def get_score(self, docid: str) -> float:
         """
@@ -57,7 +118,38 @@ class QualityScorer(Component):
             Args:
                 docid: string identifier of the document
         """
-        return self.docno2score.get(docid, None)
+        key = docid.encode('utf-8')
+        pos = int(np.searchsorted(self.docnos, key, side='right')) - 1 # last of duplicated docnos, as a dict would keep
+        if pos >= 0 and self.docnos[pos] == key:
+            return float(self.scores[pos])
+        return None
+
+    def get_scores_array(self, docids: list) -> np.ndarray:
+        """
+            Get the quality scores of a batch of documents as a float32 array, with a single binary search over the sorted docnos.
+            Documents without a quality score are returned as NaN.
+
+            Args:
+                docids: list of string identifiers of the documents
+        """
+        keys = np.array([docid.encode('utf-8') for docid in docids], dtype=np.bytes_)
+        scores = np.full(len(keys), np.nan, dtype=np.float32)
+        if len(keys) == 0 or len(self.docnos) == 0:
+            return scores
+        pos = np.searchsorted(self.docnos, keys, side='right') - 1
+        found = (pos >= 0) & (self.docnos[np.maximum(pos, 0)] == keys)
+        scores[found] = self.scores[pos[found]]
+        return scores
+
+    def get_scores(self, docids: list) -> list:
+        """
+            Get the quality scores of a batch of documents (None for documents without a quality score)
+
+            Args:
+                docids: list of string identifiers of the documents
+        """
+        scores = self.get_scores_array(docids).tolist()
+        return [None if score != score else score for score in scores] # NaN marks missing scores
         
     def log(self, msg: str) -> None:
         """
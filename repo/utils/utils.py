@@ -1,30 +1,64 @@
 import os
 import gzip
+import zlib
 import json
-from io import BytesIO
+import mmap
+try:
+    import orjson # faster JSON decoder, used if available
+except ImportError:
+    orjson = None
+try:
+    from isal import isal_zlib # faster inflate (ISA-L), used if available
+except ImportError:
+    isal_zlib = None
+from functools import lru_cache
 from typing import Tuple
 import random
+import numpy as np
 from typing import Dict, Iterator
 
 SEED = 42
 
+SHARD_CACHE_SIZE = 64 # number of ClueWeb22 shards kept memory-mapped by navigate_to_id
+
+READ_BUFFER_SIZE = 1 << 20 # buffer size used to read compressed files
+
+json_loads = orjson.loads if orjson is not None else json.loads # both accept bytes
+
+zlib_decompress = isal_zlib.decompress if isal_zlib is not None else zlib.decompress # same signature
+
+GZIP_WBITS = 16 + zlib.MAX_WBITS # gzip header and trailer
+
 # set random seed
 random.seed(SEED)
 
 
 def read_docids(docids_fpath: str) -> list:
     """
-        Read the docids from a file and return them as a list.
+        Read the docids from a file, one per line, and return them as a list.
+        The file is read at once and split by the C splitlines.
 
         Args:
             docids_fpath: path to the file containing docids
     """
-    docids = []
-    with open(docids_fpath, "r") as f:
-        for line in f:
-            docid = line.strip()
-            docids.append(docid)
-    return docids
+    with open(docids_fpath, "r", buffering=READ_BUFFER_SIZE) as f:
+        return f.read().splitlines()
+
+def sample_keys(mapping: Dict, n: int, rng: np.random.Generator | None = None) -> list:
+    """
+        Sample n keys uniformly at random from a dict without materialising the list of its keys.
+        Keys are returned in the dict's iteration order.
+
+        Args:
+            mapping: dict to sample keys from
+            n: number of keys to sample
+            rng: numpy random generator used to sample positions (python's random module if None)
+    """
+    if rng is None:
+        positions = set(random.sample(range(len(mapping)), n)) # sample positions from a cheap range
+    else:
+        positions = set(rng.choice(len(mapping), size=n, replace=False).tolist())
+    return [key for pos, key in enumerate(mapping) if pos in positions]
 
 def yield_initial_seeds(initial_seeds_fpath: str, limit: int | None = None) -> Iterator[str]:
     """
@@ -51,26 +85,27 @@ def read_json_gz(file_path: str) -> Iterator[Dict]:
             file_path: path to the gzipped file
     """
     data = []
-    with gzip.open(file_path, 'rt', encoding='utf-8') as f:
+    # lines are parsed as utf-8 bytes, skipping the text decoding layer, and the compressed file is read in large chunks
+    with open(file_path, 'rb', buffering=READ_BUFFER_SIZE) as raw, gzip.open(raw, 'rb') as f:
         for line in f:
             stripped_line = line.strip()
             if not stripped_line:
                 continue  # skip empty lines
             try:
-                yield json.loads(stripped_line)  # parse JSON obj.
-            except json.JSONDecodeError as e:
-                print(f"Error decoding line: {stripped_line}\n{e}")
+                yield json_loads(stripped_line)  # parse JSON obj.
+            except json.JSONDecodeError as e: # also raised by orjson
+                print(f"Error decoding line: {stripped_line.decode('utf-8', errors='replace')}\n{e}")
     return data
 
 def decompress_gzip_data(compressed_data: bytes) -> bytes:
     """
-        Decompresses a gzip compressed data.
+        Decompresses a gzip compressed data, made of a single gzip member (as each document of a ClueWeb22 file).
+        The member is inflated in a single call, without the file object layer of gzip.GzipFile.
         
         Args:
             compressed_data: compressed data to decompress
     """
-    with gzip.GzipFile(fileobj=BytesIO(compressed_data), mode='rb') as f:
-        return f.read()
+    return zlib_decompress(compressed_data, wbits=GZIP_WBITS)
 
 def random_read_json_gz(file_path: str, start_offset: int, end_offset: int | None = None) -> Dict:
     """
@@ -81,16 +116,58 @@ def random_read_json_gz(file_path: str, start_offset: int, end_offset: int | Non
             start_offset: start offset to read from
             end_offset: end offset to read until
     """
-    with open(file_path, 'rb') as gz_file:
-        gz_file.seek(start_offset)
-        read_length = None if end_offset is None else (end_offset - start_offset)
-        compressed_document = gz_file.read(read_length)
-        decompressed_line = decompress_gzip_data(compressed_document).decode('utf-8') 
+    compressed_document = map_file(file_path)[start_offset:end_offset] # the file is opened and mapped once, not at every read
+    decompressed_line = decompress_gzip_data(compressed_document) # utf-8 bytes, parsed without decoding them to str first
      
-        try:
-            return json.loads(decompressed_line)
-        except json.JSONDecodeError as e:
-            return None   
+    try:
+        return json_loads(decompressed_line)
+    except json.JSONDecodeError as e: # also raised by orjson
+        return None   
+
+@lru_cache(maxsize=SHARD_CACHE_SIZE)
+def load_offsets(file_path: str) -> np.ndarray:
+    """
+        Load an offsets file (one 10-digit offset per line) as an int64 array, parsed once per file.
+
+        Args:
+            file_path: path to the file containing offsets
+    """
+    with open(file_path, 'rb') as f:
+        return np.array(f.read().split(), dtype=np.int64)
+
+def parse_offsets(offsets: np.ndarray, i: int) -> Tuple[int, int]:
+    """
+        Get the start and end offsets of the i-th document from the array of offsets of a shard.
+
+        Args:
+            offsets: int64 array of the offsets of the shard
+            i: index of the offset to read
+    """
+    start_offset = int(offsets[i])
+    end_offset = int(offsets[i + 1]) if i + 1 < len(offsets) else None
+    return start_offset, end_offset
+
+@lru_cache(maxsize=SHARD_CACHE_SIZE)
+def map_file(file_path: str) -> mmap.mmap:
+    """
+        Memory-map a file read-only, once per file.
+        Slices of the map are read without system calls, and from several threads without sharing a file position.
+
+        Args:
+            file_path: path to the file
+    """
+    with open(file_path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) # stays valid after the file is closed
+
+def open_shard(file_prefix: str) -> Tuple[mmap.mmap, np.ndarray]:
+    """
+        Memory-map the gzipped JSON file of a shard and load its offsets, once per shard.
+        Returns a tuple storing the memory-mapped file and the int64 array of offsets.
+
+        Args:
+            file_prefix: path to the shard files, without extension
+    """
+    return map_file(f"{file_prefix}.json.gz"), load_offsets(f"{file_prefix}.offset")
 
 def read_offsets(file_path: str, i: int) -> Tuple[int, int]:
     """
@@ -101,13 +178,7 @@ def read_offsets(file_path: str, i: int) -> Tuple[int, int]:
             i: index of the offset to read
 
     """
-    offset_dim = 10
-    offset_size = offset_dim+1  # 10 digits + newline
-    with open(file_path, 'r') as f:
-        f.seek(i * offset_size)
-        start_offset = int(f.read(offset_dim))
-        end_offset = int(f.read(offset_dim)) if f.read(1) else None
-    return start_offset, end_offset
+    return parse_offsets(load_offsets(file_path), i)
 
 def get_parts(id: str) -> Tuple[str, str, int]:
     """
@@ -135,13 +206,23 @@ def navigate_to_id(dir_path: str, id: str) -> None:
 
     file_fpath = f"{file_prefix}.json.gz"
     offsets_fpath = f"{file_prefix}.offset"
+
+    try:
+        data, offsets = open_shard(file_prefix)
+    except Exception as e:
+        raise RuntimeError(f"Error opening shard files={file_prefix}: {e}")
     
     try:
-        start_offset, end_offset = read_offsets(offsets_fpath, doc_seq)
+        start_offset, end_offset = parse_offsets(offsets, doc_seq)
     except Exception as e:
         raise RuntimeError(f"Error reading offsets from file={offsets_fpath}: {e}")
 
     try:
-        return random_read_json_gz(file_fpath, start_offset, end_offset)
+        decompressed_line = decompress_gzip_data(data[start_offset:end_offset])
     except Exception as e:
-        raise RuntimeError(f"Error reading from gzipped JSON file={file_fpath}: {e}")
\ No newline at end of file
+        raise RuntimeError(f"Error reading from gzipped JSON file={file_fpath}: {e}")
+
+    try:
+        return json_loads(decompressed_line)
+    except json.JSONDecodeError: # also raised by orjson
+        return None
\ No newline at end of file